@@ -1,16 +1,28 @@
 import pygame
+import argparse
+import bisect
+import collections
+import http.server
 import os
 import math
+import platform
 import heapq
+import itertools
+import json
 import random
+import struct
 import sys
+import threading
 import time
+import mmap
+from array import array
+try:
+    import numpy as np
+except ImportError:  # NumPy chỉ cần cho chế độ EnemySwarm
+    np = None
 base_path = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
 shot_path = os.path.join(base_path, "sound", "shot.mp3")
 gun_path = os.path.join(base_path, "sound", "gun.mp3")
-pygame.mixer.init()
-shot_sound = pygame.mixer.Sound(shot_path)
-gun_sound = pygame.mixer.Sound(gun_path)
 # Game Configuration
 WIDTH, HEIGHT = 800, 600
 FPS = 60
@@ -28,16 +40,579 @@ BULLET_SPEED = 3
 VELOCITY = 3
 ROTATE_SPEED = 5
 SHOOT_COOLDOWN = 0.5
+# Âm thanh
+AUDIO_CHANNELS = 8
+
+class NullAudioBackend:
+    """
+    Backend âm thanh rỗng cho các lần chạy không giao diện (máy chủ, đo tải):
+    không khởi tạo pygame.mixer, chỉ đếm số lần phát.
+    
+    Thuộc tính:
+        plays (int): Số lần được yêu cầu phát âm thanh.
+    """
+    def __init__(self):
+        self.plays = 0
+
+    def load(self, path):
+        return None
+
+    def play(self, name, sound, max_voices, priority):
+        self.plays += 1
+
+class MixerAudioBackend:
+    """
+    Backend âm thanh dùng pygame.mixer với số kênh cố định.
+    
+    Mỗi âm thanh có giới hạn số giọng (voice) phát cùng lúc; khi hết kênh, âm
+    thanh có độ ưu tiên cao hơn sẽ chiếm kênh của âm thanh ưu tiên thấp nhất và
+    cũ nhất.
+    
+    Thuộc tính:
+        channels (list): Các kênh pygame.mixer.Channel trong pool.
+        voices (list): Âm thanh đang phát trên mỗi kênh (tên, ưu tiên, thứ tự) hoặc None.
+    """
+    def __init__(self, channel_count=AUDIO_CHANNELS):
+        pygame.mixer.init()
+        pygame.mixer.set_num_channels(channel_count)
+        self.channels = [pygame.mixer.Channel(i) for i in range(channel_count)]
+        self.voices = [None] * channel_count
+        self.counter = 0
+
+    def load(self, path):
+        return pygame.mixer.Sound(path)
+
+    def pick_channel(self, name, max_voices, priority):
+        """
+        Chọn kênh để phát âm thanh, hoặc None nếu phải bỏ qua.
+        """
+        for index, channel in enumerate(self.channels):
+            if not channel.get_busy():
+                self.voices[index] = None
+
+        # Đã đủ số giọng của âm thanh này: phát lại trên giọng cũ nhất
+        same = [i for i, voice in enumerate(self.voices) if voice and voice[0] == name]
+        if len(same) >= max_voices:
+            return min(same, key=lambda i: self.voices[i][2])
+
+        free = [i for i, voice in enumerate(self.voices) if voice is None]
+        if free:
+            return free[0]
+
+        # Hết kênh: chiếm kênh có ưu tiên thấp hơn (thấp nhất, cũ nhất trước)
+        lower = [i for i, voice in enumerate(self.voices) if voice[1] < priority]
+        if lower:
+            return min(lower, key=lambda i: (self.voices[i][1], self.voices[i][2]))
+        return None
+
+    def play(self, name, sound, max_voices, priority):
+        index = self.pick_channel(name, max_voices, priority)
+        if index is None:
+            return
+        self.counter += 1
+        self.channels[index].play(sound)
+        self.voices[index] = (name, priority, self.counter)
+
+class SoundHandle:
+    """
+    Đại diện cho một âm thanh đã đăng ký với AudioManager; gọi play() để
+    yêu cầu phát (được gộp và phát khi AudioManager.flush()).
+    """
+    def __init__(self, manager, name):
+        self.manager = manager
+        self.name = name
+
+    def play(self):
+        self.manager.trigger(self.name)
+
+class AudioManager:
+    """
+    Lớp AudioManager quản lý việc phát âm thanh của trò chơi.
+    
+    Các yêu cầu phát trong cùng một tick được gộp lại (cùng một âm thanh chỉ
+    phát một lần) và chỉ được gửi tới backend khi gọi flush(). Mặc định dùng
+    NullAudioBackend; gọi use_mixer() để phát âm thanh thật.
+    
+    Thuộc tính:
+        backend: NullAudioBackend hoặc MixerAudioBackend.
+        sounds (dict): Âm thanh đã đăng ký {tên: [đường dẫn, Sound, số giọng tối đa, ưu tiên]}.
+        pending (dict): Các âm thanh được yêu cầu trong tick hiện tại.
+        muted (bool): Bỏ qua mọi yêu cầu phát (dùng khi mô phỏng thử, ví dụ AI).
+    """
+    def __init__(self):
+        self.backend = NullAudioBackend()
+        self.sounds = {}
+        self.pending = {}
+        self.muted = False
+
+    def sound(self, name, path, max_voices=2, priority=0):
+        """
+        Đăng ký một âm thanh.
+        
+        Tham số:
+            name (str): Tên âm thanh.
+            path (str): Đường dẫn file âm thanh.
+            max_voices (int): Số lần phát chồng nhau tối đa.
+            priority (int): Độ ưu tiên khi tranh kênh (lớn hơn là ưu tiên hơn).
+            
+        Trả về:
+            SoundHandle: Đối tượng có phương thức play().
+        """
+        self.sounds[name] = [path, self.backend.load(path), max_voices, priority]
+        return SoundHandle(self, name)
+
+    def use_mixer(self, channel_count=AUDIO_CHANNELS):
+        """
+        Chuyển sang phát âm thanh thật bằng pygame.mixer và nạp các âm thanh đã đăng ký.
+        """
+        self.backend = MixerAudioBackend(channel_count)
+        for entry in self.sounds.values():
+            entry[1] = self.backend.load(entry[0])
+
+    def trigger(self, name):
+        """
+        Yêu cầu phát âm thanh trong tick hiện tại.
+        """
+        if self.muted:
+            return
+        self.pending[name] = self.pending.get(name, 0) + 1
+
+    def flush(self):
+        """
+        Phát các âm thanh đã được yêu cầu, mỗi âm thanh một lần, ưu tiên cao trước.
+        """
+        if not self.pending:
+            return
+        names = sorted(self.pending, key=lambda name: -self.sounds[name][3])
+        self.pending.clear()
+        for name in names:
+            _, sound, max_voices, priority = self.sounds[name]
+            self.backend.play(name, sound, max_voices, priority)
+
+audio = AudioManager()
+shot_sound = audio.sound("shot", shot_path, max_voices=3, priority=1)
+gun_sound = audio.sound("gun", gun_path, max_voices=2, priority=0)
+
+class Histogram:
+    """
+    Lớp Histogram đếm số giá trị rơi vào từng khoảng (bucket) cố định.
+    
+    Thuộc tính:
+        bounds (tuple): Cận trên của các bucket (tăng dần); bucket cuối không giới hạn.
+        counts (list): Số giá trị trong từng bucket.
+        total (float): Tổng các giá trị.
+        count (int): Số giá trị đã ghi.
+    """
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def snapshot(self):
+        return {"bounds": list(self.bounds), "counts": list(self.counts),
+                "sum": self.total, "count": self.count}
+
+class Telemetry:
+    """
+    Lớp Telemetry thu thập số liệu của trò chơi: bộ đếm, histogram và sự kiện
+    (ví dụ kết thúc trận).
+    
+    Vòng lặp game chỉ cộng số vào dict và list có sẵn; việc ghi ra ngoài chạy
+    trên luồng nền: định kỳ ghi một dòng JSON vào file (xoay vòng khi đầy), và/hoặc
+    trả lời HTTP ở dạng văn bản Prometheus. Luồng nền chỉ đọc bản sao của số liệu
+    nên không bao giờ chặn vòng lặp game.
+    
+    Thuộc tính:
+        counters (dict): Bộ đếm {tên: giá trị}.
+        histograms (dict): {tên: Histogram}.
+        events (collections.deque): Các sự kiện chờ ghi ra file.
+        muted (bool): Bỏ qua mọi số liệu (dùng khi mô phỏng thử, ví dụ AI).
+    """
+    TIME_BUCKETS = (0.0005, 0.001, 0.002, 0.004, 0.008, 0.0167, 0.033, 0.066, 0.1)
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.events = collections.deque(maxlen=10000)
+        self.muted = False
+        self.started = time.time()
+        self.stop_event = threading.Event()
+        self.threads = []
+        self.server = None
+
+    def histogram(self, name, bounds=TIME_BUCKETS):
+        """
+        Khai báo một histogram với các bucket cho trước.
+        """
+        self.histograms[name] = Histogram(bounds)
+
+    def count(self, name, amount=1):
+        if self.muted:
+            return
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, value):
+        if self.muted:
+            return
+        self.histograms[name].observe(value)
+
+    def event(self, name, **fields):
+        if self.muted:
+            return
+        fields["event"] = name
+        fields["time"] = time.time()
+        self.events.append(fields)
+
+    def snapshot(self):
+        """
+        Chụp lại toàn bộ số liệu hiện tại (dict thường, ghi được ra JSON).
+        """
+        return {
+            "time": time.time(),
+            "uptime": time.time() - self.started,
+            "counters": dict(self.counters),
+            "histograms": {name: histogram.snapshot()
+                           for name, histogram in list(self.histograms.items())},
+        }
+
+    def prometheus_text(self):
+        """
+        Định dạng số liệu theo văn bản Prometheus (bộ đếm và histogram cộng dồn).
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"# TYPE tank_{name} counter")
+            lines.append(f"tank_{name} {value}")
+        for name, histogram in sorted(snapshot["histograms"].items()):
+            lines.append(f"# TYPE tank_{name} histogram")
+            cumulative = 0
+            for bound, count in zip(histogram["bounds"] + ["+Inf"], histogram["counts"]):
+                cumulative += count
+                lines.append(f'tank_{name}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f"tank_{name}_sum {histogram['sum']}")
+            lines.append(f"tank_{name}_count {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    def start_jsonl(self, path, interval=10.0, max_bytes=10 * 1024 * 1024, backups=5):
+        """
+        Bắt đầu ghi số liệu ra file JSONL trên luồng nền.
+        
+        Mỗi interval giây, các sự kiện mới và một bản chụp số liệu được nối vào
+        file; khi file vượt quá max_bytes thì được đổi tên thành path.1, path.2, ...
+        (giữ tối đa backups file cũ).
+        """
+        def run():
+            while not self.stop_event.wait(interval):
+                self.write_jsonl(path, max_bytes, backups)
+            self.write_jsonl(path, max_bytes, backups)
+
+        self.start_thread(run)
+
+    def write_jsonl(self, path, max_bytes, backups):
+        lines = []
+        while self.events:
+            lines.append(json.dumps(self.events.popleft()))
+        lines.append(json.dumps(self.snapshot()))
+        data = "\n".join(lines) + "\n"
+        try:
+            if os.path.exists(path) and os.path.getsize(path) + len(data) > max_bytes:
+                for index in range(backups - 1, 0, -1):
+                    if os.path.exists(f"{path}.{index}"):
+                        os.replace(f"{path}.{index}", f"{path}.{index + 1}")
+                os.replace(path, f"{path}.1")
+            with open(path, "a", encoding="utf-8") as file:
+                file.write(data)
+        except OSError:
+            pass
+
+    def serve_prometheus(self, port, host="127.0.0.1"):
+        """
+        Mở endpoint HTTP trả số liệu dạng Prometheus (ví dụ http://127.0.0.1:9100/metrics).
+        """
+        telemetry = self
+
+        class MetricsHandler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = telemetry.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+        self.start_thread(self.server.serve_forever)
+
+    def start_thread(self, target):
+        thread = threading.Thread(target=target, name="telemetry", daemon=True)
+        thread.start()
+        self.threads.append(thread)
+
+    def stop(self):
+        """
+        Dừng các luồng nền (lần ghi file cuối cùng được thực hiện trước khi dừng).
+        """
+        self.stop_event.set()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        for thread in self.threads:
+            thread.join()
+        self.threads.clear()
+        self.stop_event.clear()
+
+telemetry = Telemetry()
+telemetry.histogram("frame_seconds")
+telemetry.histogram("path_search_seconds", (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005))
+telemetry.histogram("match_duration_seconds", (15, 30, 60, 120, 300, 600))
+telemetry.histogram("server_tick_seconds")
+
+# Phím điều khiển của hai người chơi
+PLAYER1_CONTROLS = {
+    "up": pygame.K_w, "down": pygame.K_s,
+    "left": pygame.K_a, "right": pygame.K_d,
+    "shoot": pygame.K_SPACE
+}
+PLAYER2_CONTROLS = {
+    "up": pygame.K_UP, "down": pygame.K_DOWN,
+    "left": pygame.K_LEFT, "right": pygame.K_RIGHT,
+    "shoot": pygame.K_RETURN
+}
+# Kích thước lưới mê cung (số ô theo chiều ngang, chiều dọc)
+MAZE_COLS, MAZE_ROWS = 15, 10
+# Bộ đếm cấp mã định danh (uid) cho đạn và kẻ địch, dùng khi đồng bộ qua mạng
+entity_ids = itertools.count(1)
+
+class GridGeometry:
+    """
+    Lớp GridGeometry chuyển đổi giữa tọa độ màn hình và tọa độ ô lưới.
+    
+    Mỗi mê cung tạo ra một đối tượng GridGeometry riêng, để Enemy, EnemyManager
+    và phần sinh kẻ địch dùng chung cùng một cách quy đổi cho cả hai trục.
+    
+    Thuộc tính:
+        cols, rows: Số cột và số hàng của lưới
+        cell_w, cell_h: Kích thước mỗi ô theo trục x và trục y (pixel)
+    """
+    # Tám hướng đi giữa các ô (dùng chung cho A*, Dijkstra và flow field)
+    DIRECTIONS = [(0,1), (1,0), (0,-1), (-1,0), (1,1), (-1,-1), (1,-1), (-1,1)]
+
+    def __init__(self, cols, rows, cell_w, cell_h):
+        self.cols = cols
+        self.rows = rows
+        self.cell_w = cell_w
+        self.cell_h = cell_h
+
+    def to_cell(self, x, y):
+        """
+        Chuyển tọa độ màn hình sang ô lưới (giới hạn trong phạm vi lưới).
+        
+        Tham số:
+            x, y: Tọa độ trên màn hình
+            
+        Trả về:
+            Tuple (cột, hàng)
+        """
+        col = min(max(int(x) // self.cell_w, 0), self.cols - 1)
+        row = min(max(int(y) // self.cell_h, 0), self.rows - 1)
+        return col, row
+
+    def to_world(self, col, row):
+        """
+        Lấy tọa độ tâm của một ô lưới trên màn hình.
+        
+        Tham số:
+            col, row: Cột và hàng của ô
+            
+        Trả về:
+            Tuple (x, y) là tâm ô
+        """
+        return (col * self.cell_w + self.cell_w // 2,
+                row * self.cell_h + self.cell_h // 2)
+
+    def in_bounds(self, col, row):
+        """
+        Kiểm tra ô có nằm trong lưới không.
+        """
+        return 0 <= col < self.cols and 0 <= row < self.rows
+
+    def path_distances(self, grid, source):
+        """
+        Độ dài đường đi ngắn nhất (tính theo ô, 8 hướng như Enemy.astar) từ một ô
+        tới mọi ô của lưới, bằng Dijkstra trên số thực đầy đủ.
+        
+        Tham số:
+            grid: Lưới mê cung (0 là ô trống, 1 là tường)
+            source (int): Chỉ số ô nguồn (hàng * số cột + cột)
+            
+        Trả về:
+            list: Khoảng cách tới từng ô theo chỉ số; vô cùng nếu không tới được.
+        """
+        cols, rows = self.cols, self.rows
+        distance = [math.inf] * (cols * rows)
+        distance[source] = 0.0
+        heap = [(0.0, source)]
+        while heap:
+            cost, current = heapq.heappop(heap)
+            if cost > distance[current]:
+                continue
+            col, row = current % cols, current // cols
+            for dx, dy in self.DIRECTIONS:
+                ncol, nrow = col + dx, row + dy
+                if 0 <= ncol < cols and 0 <= nrow < rows and not grid[nrow][ncol]:
+                    neighbor = nrow * cols + ncol
+                    new_cost = cost + math.hypot(dx, dy)
+                    if new_cost < distance[neighbor]:
+                        distance[neighbor] = new_cost
+                        heapq.heappush(heap, (new_cost, neighbor))
+        return distance
+
+class VisibilityCache:
+    """
+    Lớp VisibilityCache trả lời truy vấn tầm nhìn (line-of-sight) giữa hai ô lưới.
+    
+    Tầm nhìn được tính bằng cách duyệt tia qua lưới (supercover DDA) và lưu lại
+    theo từng ô nguồn dưới dạng bitset, chỉ điền khi có truy vấn. Mỗi mê cung
+    có một VisibilityCache riêng.
+    
+    Thuộc tính:
+        grid: Lưới mê cung (0 là ô trống, 1 là tường)
+        geometry: Đối tượng GridGeometry của mê cung
+        known: Bitset các ô đích đã được tính cho mỗi ô nguồn
+        visible: Bitset các ô đích nhìn thấy được cho mỗi ô nguồn
+    """
+    def __init__(self, grid, geometry):
+        self.grid = grid
+        self.geometry = geometry
+        cell_count = geometry.cols * geometry.rows
+        self.known = [0] * cell_count
+        self.visible = [0] * cell_count
+
+    def is_free(self, col, row):
+        """
+        Kiểm tra ô nằm trong lưới và không phải tường.
+        """
+        return self.geometry.in_bounds(col, row) and self.grid[row][col] == 0
+
+    def ray_cells(self, start, end):
+        """
+        Liệt kê các ô mà đoạn thẳng nối tâm hai ô đi qua.
+        
+        Khi tia đi đúng qua góc ô, cả hai ô kề góc đều được trả về để
+        không "lách" qua khe giữa hai bức tường chéo nhau.
+        
+        Tham số:
+            start: Ô bắt đầu (cột, hàng)
+            end: Ô kết thúc (cột, hàng)
+            
+        Trả về:
+            Generator các ô (cột, hàng) theo thứ tự dọc theo tia
+        """
+        col, row = start
+        dx = end[0] - start[0]
+        dy = end[1] - start[1]
+        nx, ny = abs(dx), abs(dy)
+        step_x = 1 if dx > 0 else -1
+        step_y = 1 if dy > 0 else -1
+        ix = iy = 0
+        yield col, row
+        while ix < nx or iy < ny:
+            decision = (1 + 2 * ix) * ny - (1 + 2 * iy) * nx
+            if decision == 0:
+                # Đi qua góc ô: kiểm tra cả hai ô kề
+                yield col + step_x, row
+                yield col, row + step_y
+                col += step_x
+                row += step_y
+                ix += 1
+                iy += 1
+            elif decision < 0:
+                col += step_x
+                ix += 1
+            else:
+                row += step_y
+                iy += 1
+            yield col, row
+
+    def line_of_sight(self, start, end):
+        """
+        Kiểm tra hai ô có nhìn thấy nhau không (không có tường chắn giữa).
+        
+        Tham số:
+            start: Ô bắt đầu (cột, hàng)
+            end: Ô kết thúc (cột, hàng)
+            
+        Trả về:
+            True nếu nhìn thấy nhau, ngược lại False
+        """
+        if not (self.is_free(*start) and self.is_free(*end)):
+            return False
+
+        cols = self.geometry.cols
+        a = start[1] * cols + start[0]
+        b = end[1] * cols + end[0]
+        bit = 1 << b
+        if self.known[a] & bit:
+            return bool(self.visible[a] & bit)
+
+        result = all(self.is_free(col, row) for col, row in self.ray_cells(start, end))
+
+        # Tầm nhìn có tính đối xứng nên điền luôn cho cả hai chiều
+        self.known[a] |= bit
+        self.known[b] |= 1 << a
+        if result:
+            self.visible[a] |= bit
+            self.visible[b] |= 1 << a
+        return result
+
+    def smooth_path(self, start, path):
+        """
+        Rút gọn đường đi bằng cách bỏ các điểm trung gian nhìn thấy được
+        trực tiếp (kiểu Theta*), để kẻ địch đi thẳng thay vì đi zigzag theo ô.
+        
+        Tham số:
+            start: Ô bắt đầu (cột, hàng)
+            path: Danh sách các ô do A* trả về (không gồm ô bắt đầu)
+            
+        Trả về:
+            Danh sách các ô đã được rút gọn
+        """
+        smoothed = []
+        anchor = start
+        previous = None
+        for node in path:
+            if previous is not None and not self.line_of_sight(anchor, node):
+                smoothed.append(previous)
+                anchor = previous
+            previous = node
+        if previous is not None:
+            smoothed.append(previous)
+        return smoothed
+
 class Enemy:
     """
     Lớp Enemy đại diện cho đối tượng kẻ địch trong trò chơi.
     
     Thuộc tính:
+        uid: Mã định danh duy nhất của kẻ địch
         image_original: Hình ảnh gốc của kẻ địch
         image: Hình ảnh sau khi xoay
         rect: Hình chữ nhật bao quanh kẻ địch
         grid: Lưới dùng để di chuyển
-        cell_size: Kích thước mỗi ô trong lưới
+        geometry: Đối tượng GridGeometry để quy đổi tọa độ màn hình và ô lưới
+        visibility: Đối tượng VisibilityCache dùng chung của mê cung
+        distances: Bảng khoảng cách đường đi giữa các ô (MazeArtifact.distances), có thể None
         angle: Góc quay hiện tại của kẻ địch
         speed: Tốc độ di chuyển của kẻ địch
         path: Đường đi tới mục tiêu
@@ -50,19 +625,20 @@ class Enemy:
         move_timer: Bộ đếm thời gian di chuyển
         path_update_timer: Bộ đếm thời gian cập nhật đường đi
     """
-    def __init__(self, x, y, grid, cell_size=53):
-          
+    def __init__(self, x, y, grid, geometry, visibility, distances=None):
+        self.uid = next(entity_ids)
         self.image_original = pygame.Surface((10, 10), pygame.SRCALPHA)
         self.image_original.fill(RED)
         self.image = self.image_original.copy()
         self.rect = self.image.get_rect(center=(x, y))
         self.grid = grid
-        self.cell_size = cell_size
+        self.geometry = geometry
+        self.visibility = visibility
+        self.distances = distances
         self.angle = 0
         self.speed = 1
         self.path = []
-        self.grid_x = x // cell_size
-        self.grid_y = y // cell_size
+        self.grid_x, self.grid_y = geometry.to_cell(x, y)
       
         self.target_player = None
         self.detection_range = 350  # Phạm vi phát hiện người chơi
@@ -75,15 +651,6 @@ class Enemy:
         self.move_timer = 0
         self.path_update_timer = 0
 
-    def draw(self, screen): 
-        """
-        Vẽ kẻ địch lên màn hình.
-        
-        Tham số:
-            screen: Đối tượng Surface của pygame để vẽ lên
-        """
-        screen.blit(self.image, self.rect)
-
     def heuristic(self, a, b): 
         """
         Tính toán hàm heuristic cho thuật toán A* dựa trên khoảng cách.
@@ -108,11 +675,20 @@ class Enemy:
         Trả về:
             Danh sách các điểm tạo thành đường đi
         """
+        # Bỏ qua ngay các lượt tìm chắc chắn thất bại (đích là tường hoặc ngoài lưới)
+        if start == end:
+            return []
+        if (not self.geometry.in_bounds(*end) or
+                self.grid[end[1]][end[0]] != 0):
+            return []
+
+        telemetry.count("path_searches")
+        search_start = time.perf_counter()
         heap = []
         heapq.heappush(heap, (0, start))
         came_from = {}
         cost_so_far = {start: 0}
-        directions = [(0,1), (1,0), (0,-1), (-1,0), (1,1), (-1,-1), (1,-1), (-1,1)]
+        directions = GridGeometry.DIRECTIONS
 
         while heap:
             _, current = heapq.heappop(heap)
@@ -133,6 +709,7 @@ class Enemy:
                         priority = new_cost + self.heuristic(end, neighbor)
                         heapq.heappush(heap, (priority, neighbor))
                         came_from[neighbor] = current
+        telemetry.observe("path_search_seconds", time.perf_counter() - search_start)
 
         # Xây dựng đường đi
         path = []
@@ -158,7 +735,10 @@ class Enemy:
         return self.rect.colliderect(bullet_rect)
     def find_nearest_player(self, players):
         """
-        Tìm người chơi gần nhất trong phạm vi phát hiện.
+        Tìm người chơi gần nhất trong phạm vi phát hiện, ưu tiên người chơi
+        nhìn thấy được (không bị tường che). Nếu không thấy ai, chọn người chơi
+        có đường đi (theo bảng khoảng cách của mê cung) ngắn nhất trong phạm vi,
+        nên không chạy A* tới người chơi ở quá xa hoặc không đi tới được.
         
         Tham số:
             players: Danh sách người chơi
@@ -168,19 +748,43 @@ class Enemy:
         """
         nearest_player = None
         min_distance = self.detection_range
+        start = (self.grid_x, self.grid_y)
+        cells = [self.geometry.to_cell(*player.rect.center) for player in players]
         
-        for player in players:
+        for player, cell in zip(players, cells):
             distance = math.hypot(
                 self.rect.centerx - player.rect.centerx,
                 self.rect.centery - player.rect.centery
             )
             
+            if distance < min_distance and self.visibility.line_of_sight(start, cell):
+                min_distance = distance
+                nearest_player = player
+        if nearest_player is not None:
+            return nearest_player
+
+        for player, cell in zip(players, cells):
+            distance = self.path_distance(start, cell, player)
             if distance < min_distance:
                 min_distance = distance
                 nearest_player = player
                 
         return nearest_player
 
+    def path_distance(self, start, end, player):
+        """
+        Độ dài đường đi (pixel, ước lượng theo kích thước ô trung bình) từ ô start
+        tới ô end; không có bảng khoảng cách thì dùng khoảng cách thẳng tới người chơi.
+        """
+        if self.distances is None:
+            return math.hypot(self.rect.centerx - player.rect.centerx,
+                              self.rect.centery - player.rect.centery)
+        geometry = self.geometry
+        cell_count = geometry.cols * geometry.rows
+        cells = self.distances[(start[1] * geometry.cols + start[0]) * cell_count +
+                               end[1] * geometry.cols + end[0]]
+        return cells * (geometry.cell_w + geometry.cell_h) / 2
+
     def update_target_and_path(self, players):
         """
         Cập nhật mục tiêu và đường đi tới người chơi gần nhất.
@@ -191,12 +795,16 @@ class Enemy:
         self.target_player = self.find_nearest_player(players)
         
         if self.target_player:
-            target_x, target_y = self.target_player.rect.center
-            target_cell = (target_x // self.cell_size, target_y // self.cell_size)
+            target_cell = self.geometry.to_cell(*self.target_player.rect.center)
             start_cell = (self.grid_x, self.grid_y)
             
-            # Chỉ tính toán lại đường đi nếu mục tiêu đã thay đổi đáng kể
-            self.path = self.astar(start_cell, target_cell)
+            # Mục tiêu nằm trong tầm nhìn thì đi thẳng, không cần A*; bị tường che
+            # thì tìm đường bằng A* rồi làm mượt theo tầm nhìn
+            if self.visibility.line_of_sight(start_cell, target_cell):
+                self.path = [target_cell] if target_cell != start_cell else []
+                return
+
+            self.path = self.visibility.smooth_path(start_cell, self.astar(start_cell, target_cell))
 
     def move_along_path(self):
         """
@@ -206,8 +814,7 @@ class Enemy:
             # Bắt đầu di chuyển tới ô tiếp theo
             next_cell = self.path.pop(0)
             self.grid_x, self.grid_y = next_cell
-            self.target_x = self.grid_x * self.cell_size + self.cell_size // 2
-            self.target_y = self.grid_y * self.cell_size + self.cell_size // 2
+            self.target_x, self.target_y = self.geometry.to_world(self.grid_x, self.grid_y)
             self.moving = True
             
             # Xoay tank theo hướng di chuyển
@@ -236,17 +843,19 @@ class Enemy:
                 self.rect.center = (self.target_x, self.target_y)
                 self.moving = False
     
-    def check_collision_with_players(self, players):
+    def check_collision_with_players(self, players, current_time=None):
         """
         Kiểm tra va chạm với người chơi và gây sát thương.
         
         Tham số:
             players: Danh sách người chơi
+            current_time: Thời gian hiện tại (ms), mặc định lấy từ pygame
             
         Trả về:
             True nếu có va chạm, ngược lại False
         """
-        current_time = pygame.time.get_ticks()
+        if current_time is None:
+            current_time = pygame.time.get_ticks()
         
         for player in players:
             other_player = players[1] if player == players[0] else players[0]
@@ -256,14 +865,16 @@ class Enemy:
                     return True
         return False
 
-    def update(self, players):
+    def update(self, players, current_time=None):
         """
         Cập nhật trạng thái của kẻ địch.
         
         Tham số:
             players: Danh sách người chơi
+            current_time: Thời gian hiện tại (ms), mặc định lấy từ pygame
         """
-        current_time = pygame.time.get_ticks()
+        if current_time is None:
+            current_time = pygame.time.get_ticks()
         if current_time - self.path_update_timer > 400:
             self.update_target_and_path(players)
             self.path_update_timer = current_time
@@ -272,7 +883,7 @@ class Enemy:
         self.move_along_path()
         
         # Kiểm tra va chạm với người chơi
-        self.check_collision_with_players(players)
+        self.check_collision_with_players(players, current_time)
 
 class EnemyManager:
     """
@@ -280,26 +891,37 @@ class EnemyManager:
     
     Thuộc tính:
         grid: Lưới dùng để di chuyển
-        cell_size: Kích thước mỗi ô trong lưới
+        geometry: Đối tượng GridGeometry của mê cung hiện tại
+        visibility: Bộ nhớ đệm tầm nhìn giữa các ô, dùng chung cho mọi kẻ địch
+        distances: Bảng khoảng cách đường đi của MazeArtifact (None nếu không có)
         enemies: Danh sách các kẻ địch đang hoạt động
         spawn_timer: Bộ đếm thời gian sinh kẻ địch
         spawn_interval: Khoảng thời gian giữa các lần sinh kẻ địch
         max_enemies: Số lượng kẻ địch tối đa
+        rng: Bộ sinh số ngẫu nhiên dùng khi chọn vị trí sinh
+        spawned, killed: Số kẻ địch đã sinh và đã bị tiêu diệt (cho telemetry)
     """
-    def __init__(self, grid, cell_size=53):
+    def __init__(self, grid, geometry, rng=random, maze=None):
         self.grid = grid
-        self.cell_size = cell_size
+        self.rng = rng
+        self.geometry = geometry
+        # Bảng tầm nhìn của MazeArtifact đã được tính sẵn
+        self.visibility = maze.visibility_cache() if maze else VisibilityCache(grid, geometry)
+        self.distances = maze.distances if maze else None
         self.enemies = []
+        self.spawned = 0
+        self.killed = 0
         # Spawn settings
         self.spawn_timer = 0
         self.spawn_interval = 5000  # Khoảng thời gian giữa các lần sinh kẻ địch
         self.max_enemies = 10
-    def check_bullets_hit(self, players):
+    def check_bullets_hit(self, players, current_time=None):
         """
         Kiểm tra đạn bắn trúng kẻ địch.
         
         Tham số:
             players: Danh sách người chơi
+            current_time: Thời gian hiện tại (ms)
             
         Trả về:
             True nếu có va chạm, ngược lại False
@@ -313,12 +935,15 @@ class EnemyManager:
                         if enemy in self.enemies:
                             self.enemies.remove(enemy)
                         player.score+=1
+                        self.killed += 1
+                        telemetry.count("enemies_killed")
                         shot_sound.play()
                         return True  # Có va chạm với bullet
 
                 # Kiểm tra va chạm với người chơi
-                if enemy in self.enemies and enemy.check_collision_with_players(players):
+                if enemy in self.enemies and enemy.check_collision_with_players(players, current_time):
                     self.enemies.remove(enemy)
+                    telemetry.count("enemy_hits")
                     shot_sound.play()
                     return True
         return False
@@ -338,8 +963,7 @@ class EnemyManager:
         for y in range(len(self.grid)):
             for x in range(len(self.grid[0])):
                 if self.grid[y][x] == 0:  # Ô trống
-                    cell_x = x * self.cell_size + self.cell_size // 2
-                    cell_y = y * self.cell_size + self.cell_size // 2
+                    cell_x, cell_y = self.geometry.to_world(x, y)
                     
                     # Kiểm tra khoảng cách với players
                     if players:
@@ -359,15 +983,13 @@ class EnemyManager:
                         empty_cells.append((cell_x, cell_y))
         
         if empty_cells:
-            return random.choice(empty_cells)
+            return self.rng.choice(empty_cells)
         
         # Fallback: spawn ở vị trí bất kỳ
         for y in range(len(self.grid)):
             for x in range(len(self.grid[0])):
                 if self.grid[y][x] == 0:
-                    cell_x = x * self.cell_size + self.cell_size // 2
-                    cell_y = y * self.cell_size + self.cell_size // 2
-                    return cell_x, cell_y
+                    return self.geometry.to_world(x, y)
         
         return None
     
@@ -384,8 +1006,11 @@ class EnemyManager:
         spawn_pos = self.find_spawn_position(players)
         if spawn_pos:
             spawn_x, spawn_y = spawn_pos
-            new_enemy = Enemy(spawn_x, spawn_y, self.grid, self.cell_size)
+            new_enemy = Enemy(spawn_x, spawn_y, self.grid, self.geometry, self.visibility,
+                              self.distances)
             self.enemies.append(new_enemy)
+            self.spawned += 1
+            telemetry.count("enemies_spawned")
     
     def remove_enemy(self, enemy):
         """
@@ -397,17 +1022,19 @@ class EnemyManager:
         if enemy in self.enemies:
             self.enemies.remove(enemy)
     
-    def update(self, players):
+    def update(self, players, current_time=None):
         """
         Cập nhật trạng thái của tất cả kẻ địch.
         
         Tham số:
             players: Danh sách người chơi
+            current_time: Thời gian hiện tại (ms), mặc định lấy từ pygame
         """
-        current_time = pygame.time.get_ticks()
+        if current_time is None:
+            current_time = pygame.time.get_ticks()
         
         # Kiểm tra va chạm giữa đạn và enemy
-        self.check_bullets_hit(players)
+        self.check_bullets_hit(players, current_time)
         # Auto spawn
         if current_time - self.spawn_timer >= self.spawn_interval:
             self.spawn_enemy(players)
@@ -415,88 +1042,574 @@ class EnemyManager:
         
         # Update tất cả enemies
         for enemy in self.enemies[:]:  # Sử dụng slice để tránh lỗi khi xóa
-            enemy.update(players)
+            enemy.update(players, current_time)
     
-    def draw(self, screen):
-        """
-        Vẽ tất cả kẻ địch lên màn hình.
-        
-        Tham số:
-            screen: Đối tượng Surface của pygame để vẽ lên
-        """
-        for enemy in self.enemies:
-            enemy.draw(screen) 
     def clear_all_enemies(self):
         """
         Xóa tất cả kẻ địch.
         """
-        self.enemies.clear()    
-class Bullet:
-    """
-    Lớp Bullet đại diện cho đạn trong trò chơi.
-    
-    Thuộc tính:
-        x, y: Tọa độ hiện tại của đạn
-        dx, dy: Vector hướng đạn
-        creation_time: Thời điểm tạo đạn
-        lifetime: Thời gian tồn tại tối đa của đạn
-    """
-    def __init__(self, x, y, dx, dy):
-        self.x = x
-        self.y = y
-        self.dx = dx
-        self.dy = dy
-        self.creation_time = time.time()
-        self.lifetime = 5.0
+        self.enemies.clear()
 
-    def move(self):
-        """
-        Di chuyển đạn theo hướng và tốc độ đã định.
-        """
-        self.x += self.dx * BULLET_SPEED
-        self.y += self.dy * BULLET_SPEED
+    @property
+    def count(self):
+        return len(self.enemies)
 
-    def get_rect(self):
+    def sprite_states(self):
         """
-        Lấy hình chữ nhật bao quanh đạn.
+        Lấy thông tin vẽ của các kẻ địch.
         
         Trả về:
-            Đối tượng pygame.Rect
+            Danh sách (uid, x, y, góc) theo tâm của từng kẻ địch
         """
-        return pygame.Rect(
-            self.x - BULLET_RADIUS, 
-            self.y - BULLET_RADIUS, 
-            BULLET_RADIUS * 1, 
-            BULLET_RADIUS * 1
-        )
+        return [(enemy.uid, enemy.rect.centerx, enemy.rect.centery, enemy.angle)
+                for enemy in self.enemies]
 
-    def is_off_screen(self):
+    # Định dạng nhị phân dùng trong Match.save_state
+    STATE_HEADER = struct.Struct("<ddIH")
+    STATE_ENEMY = struct.Struct("<QiiiiddiiddBdddbH")
+    STATE_CELL = struct.Struct("<HH")
+
+    def save_state(self, players):
         """
-        Kiểm tra đạn đã ra khỏi màn hình chưa.
+        Ghi bộ đếm sinh và toàn bộ kẻ địch (kèm đường đi, bộ đếm thời gian) ra bytes.
         
-        Trả về:
-            True nếu đạn đã ra khỏi màn hình, ngược lại False
+        Tham số:
+            players: Danh sách người chơi (để lưu mục tiêu dưới dạng chỉ số)
         """
-        return not (0 <= self.x <= WIDTH and 0 <= self.y <= HEIGHT)
+        parts = [self.STATE_HEADER.pack(self.spawn_timer, self.spawn_interval,
+                                        self.max_enemies, len(self.enemies))]
+        for enemy in self.enemies:
+            rect = enemy.rect
+            target = players.index(enemy.target_player) if enemy.target_player else -1
+            parts.append(self.STATE_ENEMY.pack(enemy.uid, rect.x, rect.y, rect.w, rect.h,
+                                               enemy.angle, enemy.speed, enemy.grid_x, enemy.grid_y,
+                                               enemy.target_x, enemy.target_y, enemy.moving,
+                                               enemy.move_timer, enemy.path_update_timer,
+                                               enemy.last_attack_time, target, len(enemy.path)))
+            for cell in enemy.path:
+                parts.append(self.STATE_CELL.pack(*cell))
+        return b"".join(parts)
 
-    def is_expired(self, current_time):
+    def load_state(self, data, offset, players):
         """
-        Kiểm tra đạn đã hết thời gian tồn tại chưa.
+        Khôi phục kẻ địch từ dữ liệu do save_state ghi; kẻ địch cùng mã được dùng lại.
         
         Tham số:
-            current_time: Thời gian hiện tại
+            data: Bộ đệm chứa trạng thái
+            offset: Vị trí bắt đầu trong bộ đệm
+            players: Danh sách người chơi
             
         Trả về:
-            True nếu đạn đã hết thời gian tồn tại, ngược lại False
+            Vị trí ngay sau phần dữ liệu đã đọc
         """
-        return current_time - self.creation_time > self.lifetime
+        (self.spawn_timer, self.spawn_interval, self.max_enemies,
+         count) = self.STATE_HEADER.unpack_from(data, offset)
+        offset += self.STATE_HEADER.size
+
+        existing = {enemy.uid: enemy for enemy in self.enemies}
+        enemies = []
+        for _ in range(count):
+            (uid, x, y, w, h, angle, speed, grid_x, grid_y, target_x, target_y, moving,
+             move_timer, path_update_timer, last_attack_time, target,
+             path_length) = self.STATE_ENEMY.unpack_from(data, offset)
+            offset += self.STATE_ENEMY.size
+            path = []
+            for _ in range(path_length):
+                path.append(self.STATE_CELL.unpack_from(data, offset))
+                offset += self.STATE_CELL.size
+
+            enemy = existing.get(uid)
+            if enemy is None:
+                enemy = Enemy(x, y, self.grid, self.geometry, self.visibility, self.distances)
+                enemy.uid = uid
+            if enemy.angle != angle:
+                enemy.image = pygame.transform.rotozoom(enemy.image_original, angle, 1.0)
+            enemy.rect.update(x, y, w, h)
+            enemy.angle, enemy.speed = angle, speed
+            enemy.grid_x, enemy.grid_y = grid_x, grid_y
+            enemy.target_x, enemy.target_y = target_x, target_y
+            enemy.moving = bool(moving)
+            enemy.move_timer, enemy.path_update_timer = move_timer, path_update_timer
+            enemy.last_attack_time = last_attack_time
+            enemy.target_player = players[target] if target >= 0 else None
+            enemy.path = path
+            enemies.append(enemy)
+        self.enemies[:] = enemies
+        return offset
+
+class EnemySwarm:
+    """
+    Lớp EnemySwarm quản lý rất nhiều kẻ địch cùng lúc bằng mảng NumPy.
+    
+    Thay vì mỗi kẻ địch tự chạy A* và tự di chuyển, vị trí, điểm đến, hướng và
+    tốc độ của cả đàn được lưu trong các mảng và cập nhật theo lô:
+    - Chọn mục tiêu: như Enemy.find_nearest_player, ưu tiên người chơi nhìn
+      thấy được (tra bảng tầm nhìn từ ô của người chơi), không thì người chơi
+      có đường đi ngắn nhất trong tầm; tính cho mọi kẻ địch một lượt.
+    - Dẫn đường: mỗi ô của người chơi có một trường hướng đi (flow field) tính
+      bằng Dijkstra một lần, cho biết ô kế tiếp từ mọi ô trong mê cung.
+    - Di chuyển và va chạm với người chơi, với đạn: phép toán trên mảng.
+    Tọa độ là số thực nên không còn lỗi làm tròn của rect; góc vẽ chỉ được tính
+    khi cần vẽ (sprite_states, Renderer vẽ cả đàn). Có cùng giao diện mô phỏng
+    với EnemyManager.
+    
+    Thuộc tính:
+        grid, geometry, visibility: Mê cung và bộ nhớ đệm tầm nhìn
+        maze: MazeArtifact của mê cung (bảng khoảng cách dùng cho flow field), có thể None
+        rng: Bộ sinh số ngẫu nhiên của trận đấu
+        spawn_timer, spawn_interval, max_enemies: Như EnemyManager
+        path_update_timer: Thời điểm chọn lại mục tiêu gần nhất (ms)
+        spawned, killed: Số kẻ địch đã sinh và đã bị tiêu diệt (cho telemetry)
+        uid: Mã định danh của từng kẻ địch
+        pos: Vị trí tâm (n, 2)
+        waypoint: Điểm đến hiện tại (n, 2)
+        heading: Hướng di chuyển gần nhất (n, 2), dùng để tính góc vẽ
+        speed: Tốc độ (n,)
+        moving: Đang di chuyển tới waypoint hay không (n,)
+        target: Chỉ số người chơi đang nhắm tới, -1 nếu không có (n,)
+    """
+    HALF_SIZE = 5
+    DETECTION_RANGE = 350
+    PATH_UPDATE_INTERVAL = 400
+
+    def __init__(self, grid, geometry, rng=random, maze=None):
+        if np is None:
+            raise ImportError("EnemySwarm cần NumPy (pip install numpy)")
+        self.grid = grid
+        self.geometry = geometry
+        self.rng = rng
+        self.maze = maze
+        self.visibility = maze.visibility_cache() if maze else VisibilityCache(grid, geometry)
+        self.spawn_timer = 0
+        self.spawn_interval = 5000
+        self.max_enemies = 10
+        self.path_update_timer = 0
+        self.spawned = 0
+        self.killed = 0
+
+        cols, rows = geometry.cols, geometry.rows
+        self.free_cells = np.array([row * cols + col for row in range(rows) for col in range(cols)
+                                    if grid[row][col] == 0], dtype=np.int64)
+        self.cell_centers = np.array([geometry.to_world(index % cols, index // cols)
+                                      for index in range(cols * rows)], dtype=np.float64)
+        self.flow_fields = {}
+        self.visible_rows = {}
+        self.path_rows = {}
+        self.cell_size = (geometry.cell_w + geometry.cell_h) / 2
+        self.clear_all_enemies()
 
-    def bounce(self, wall_rect):
+    @property
+    def count(self):
+        return len(self.uid)
+
+    def clear_all_enemies(self):
         """
-        Xử lý đạn nảy khi va chạm với tường.
-        
-        Tham số:
-            wall_rect: Hình chữ nhật của tường
+        Xóa tất cả kẻ địch.
+        """
+        self.uid = np.zeros(0, dtype=np.int64)
+        self.pos = np.zeros((0, 2))
+        self.waypoint = np.zeros((0, 2))
+        self.heading = np.zeros((0, 2))
+        self.speed = np.zeros(0)
+        self.moving = np.zeros(0, dtype=bool)
+        self.target = np.zeros(0, dtype=np.int8)
+
+    def keep(self, mask):
+        """
+        Chỉ giữ lại các kẻ địch có mask True.
+        """
+        self.uid = self.uid[mask]
+        self.pos = self.pos[mask]
+        self.waypoint = self.waypoint[mask]
+        self.heading = self.heading[mask]
+        self.speed = self.speed[mask]
+        self.moving = self.moving[mask]
+        self.target = self.target[mask]
+
+    def cell_index(self, col, row):
+        return row * self.geometry.cols + col
+
+    def cells_of(self, pos):
+        """
+        Tính chỉ số ô lưới của nhiều vị trí cùng lúc.
+        """
+        geometry = self.geometry
+        cols = np.clip((pos[:, 0] // geometry.cell_w).astype(np.int64), 0, geometry.cols - 1)
+        rows = np.clip((pos[:, 1] // geometry.cell_h).astype(np.int64), 0, geometry.rows - 1)
+        return rows * geometry.cols + cols
+
+    def visible_row(self, cell):
+        """
+        Bảng tầm nhìn từ một ô tới mọi ô (mảng bool), tính một lần cho mỗi ô.
+        """
+        row = self.visible_rows.get(cell)
+        if row is None:
+            cols = self.geometry.cols
+            start = (cell % cols, cell // cols)
+            row = np.array([self.visibility.line_of_sight(start, (index % cols, index // cols))
+                            for index in range(len(self.cell_centers))], dtype=bool)
+            self.visible_rows[cell] = row
+        return row
+
+    def dijkstra(self, cell):
+        """
+        Khoảng cách đường đi ngắn nhất từ một ô tới mọi ô, dùng khi không có
+        MazeArtifact (xem GridGeometry.path_distances).
+        """
+        return self.geometry.path_distances(self.grid, cell)
+
+    def path_row(self, cell):
+        """
+        Độ dài đường đi (pixel, như Enemy.path_distance) từ mọi ô tới một ô
+        (mảng float), tính một lần cho mỗi ô.
+        """
+        row = self.path_rows.get(cell)
+        if row is None:
+            if self.maze is not None:
+                cell_count = self.geometry.cols * self.geometry.rows
+                distance = self.maze.distances[cell * cell_count:(cell + 1) * cell_count]
+            else:
+                distance = self.dijkstra(cell)
+            row = np.asarray(distance, dtype=np.float64) * self.cell_size
+            self.path_rows[cell] = row
+        return row
+
+    def flow_field(self, cell):
+        """
+        Trường hướng đi tới một ô: với mỗi ô, ô kế tiếp trên đường ngắn nhất
+        (theo bảng khoảng cách của MazeArtifact hoặc dijkstra); -1 nếu không tới được.
+        """
+        field = self.flow_fields.get(cell)
+        if field is not None:
+            return field
+        cols, rows = self.geometry.cols, self.geometry.rows
+        if self.maze is not None:
+            # Đường đi 8 hướng đối xứng nên khoảng cách từ ô đích cũng là khoảng cách tới nó
+            cell_count = cols * rows
+            distance = self.maze.distances[cell * cell_count:(cell + 1) * cell_count]
+        else:
+            distance = self.dijkstra(cell)
+
+        field = np.full(cols * rows, -1, dtype=np.int64)
+        for current in range(cols * rows):
+            if distance[current] == math.inf:
+                continue
+            if current == cell:
+                field[current] = cell
+                continue
+            col, row = current % cols, current // cols
+            best = None
+            for dx, dy in GridGeometry.DIRECTIONS:
+                ncol, nrow = col + dx, row + dy
+                if 0 <= ncol < cols and 0 <= nrow < rows:
+                    neighbor = nrow * cols + ncol
+                    total = distance[neighbor] + math.hypot(dx, dy)
+                    if best is None or total < best[0]:
+                        best = (total, neighbor)
+            field[current] = best[1]
+        self.flow_fields[cell] = field
+        return field
+
+    def player_cell(self, player):
+        return self.cell_index(*self.geometry.to_cell(*player.rect.center))
+
+    def retarget(self, players):
+        """
+        Chọn mục tiêu cho mọi kẻ địch như Enemy.find_nearest_player: người chơi
+        nhìn thấy được gần nhất trong tầm phát hiện; kẻ địch không thấy ai thì
+        chọn người chơi có đường đi ngắn nhất trong tầm (đi theo flow field).
+        """
+        cells = self.cells_of(self.pos)
+        best = np.full(self.count, np.inf)
+        target = np.full(self.count, -1, dtype=np.int8)
+        for index, player in enumerate(players):
+            center = np.array(player.rect.center, dtype=np.float64)
+            distance = np.hypot(*(self.pos - center).T)
+            visible = self.visible_row(self.player_cell(player))[cells]
+            closer = visible & (distance < self.DETECTION_RANGE) & (distance < best)
+            best = np.where(closer, distance, best)
+            target[closer] = index
+
+        unseen = target < 0
+        best = np.full(self.count, np.inf)
+        for index, player in enumerate(players):
+            distance = self.path_row(self.player_cell(player))[cells]
+            closer = unseen & (distance < self.DETECTION_RANGE) & (distance < best)
+            best = np.where(closer, distance, best)
+            target[closer] = index
+        self.target = target
+
+    def steer(self, players):
+        """
+        Chọn waypoint tiếp theo cho các kẻ địch đã tới waypoint cũ và đang có mục tiêu.
+        """
+        idle = np.flatnonzero(~self.moving & (self.target >= 0))
+        if not len(idle):
+            return
+        cells = self.cells_of(self.pos[idle])
+        next_cells = np.full(len(idle), -1, dtype=np.int64)
+        for index, player in enumerate(players):
+            chasing = self.target[idle] == index
+            if not chasing.any():
+                continue
+            player_cell = self.player_cell(player)
+            # Nhìn thấy người chơi thì đi thẳng tới ô của họ, nếu không thì theo flow field
+            from_cells = cells[chasing]
+            next_cells[chasing] = np.where(self.visible_row(player_cell)[from_cells],
+                                           player_cell, self.flow_field(player_cell)[from_cells])
+        valid = (next_cells >= 0) & (next_cells != cells)
+        chosen = idle[valid]
+        self.waypoint[chosen] = self.cell_centers[next_cells[valid]]
+        self.moving[chosen] = True
+
+    def move(self):
+        """
+        Di chuyển mọi kẻ địch đang di chuyển về phía waypoint của chúng.
+        """
+        moving = np.flatnonzero(self.moving)
+        if not len(moving):
+            return
+        delta = self.waypoint[moving] - self.pos[moving]
+        distance = np.hypot(delta[:, 0], delta[:, 1])
+        speed = self.speed[moving]
+        arrived = distance <= speed
+        direction = delta / np.maximum(distance, 1e-9)[:, None]
+        self.pos[moving] = np.where(arrived[:, None], self.waypoint[moving],
+                                    self.pos[moving] + direction * speed[:, None])
+        turning = distance > 0
+        self.heading[moving[turning]] = direction[turning]
+        self.moving[moving[arrived]] = False
+
+    def overlaps(self, rect):
+        """
+        Kiểm tra hình vuông của mọi kẻ địch có giao với một pygame.Rect hay không.
+        """
+        x, y = self.pos[:, 0], self.pos[:, 1]
+        half = self.HALF_SIZE
+        return ((x - half < rect.right) & (x + half > rect.left) &
+                (y - half < rect.bottom) & (y + half > rect.top))
+
+    def check_collision_with_players(self, players):
+        """
+        Kẻ địch chạm người chơi: người chơi còn lại được cộng điểm, kẻ địch biến mất.
+        """
+        hit_any = np.zeros(self.count, dtype=bool)
+        for index, player in enumerate(players):
+            hit = self.overlaps(player.rect) & ~hit_any
+            hits = int(hit.sum())
+            if hits:
+                players[1 - index].score += hits
+                telemetry.count("enemy_hits", hits)
+                shot_sound.play()
+                hit_any |= hit
+        if hit_any.any():
+            self.keep(~hit_any)
+
+    def check_bullets_hit(self, players, current_time=None):
+        """
+        Kiểm tra đạn bắn trúng kẻ địch: mỗi viên đạn tiêu diệt tối đa một kẻ địch.
+        """
+        for player in players:
+            for bullet in player.bullets[:]:
+                if not self.count:
+                    return
+                hit = self.overlaps(bullet.get_rect())
+                if hit.any():
+                    mask = np.ones(self.count, dtype=bool)
+                    mask[np.argmax(hit)] = False
+                    self.keep(mask)
+                    player.bullets.remove(bullet)
+                    player.score += 1
+                    self.killed += 1
+                    telemetry.count("enemies_killed")
+                    shot_sound.play()
+
+    def spawn(self, count, players=None, min_distance=100):
+        """
+        Sinh nhiều kẻ địch ở các ô trống ngẫu nhiên, xa người chơi nếu có thể.
+        
+        Tham số:
+            count: Số kẻ địch muốn sinh (không vượt quá max_enemies)
+            players: Danh sách người chơi
+            min_distance: Khoảng cách tối thiểu với người chơi
+        """
+        count = min(count, self.max_enemies - self.count)
+        if count <= 0 or not len(self.free_cells):
+            return
+        centers = self.cell_centers[self.free_cells]
+        far = np.ones(len(centers), dtype=bool)
+        for player in players or []:
+            far &= np.hypot(*(centers - np.array(player.rect.center, dtype=np.float64)).T) >= min_distance
+        if far.any():
+            centers = centers[far]
+        chosen = centers[[self.rng.randrange(len(centers)) for _ in range(count)]]
+
+        self.uid = np.concatenate([self.uid, np.array([next(entity_ids) for _ in range(count)],
+                                                      dtype=np.int64)])
+        self.pos = np.concatenate([self.pos, chosen])
+        self.waypoint = np.concatenate([self.waypoint, chosen])
+        self.heading = np.concatenate([self.heading, np.zeros((count, 2))])
+        self.speed = np.concatenate([self.speed, np.ones(count)])
+        self.moving = np.concatenate([self.moving, np.zeros(count, dtype=bool)])
+        self.target = np.concatenate([self.target, np.full(count, -1, dtype=np.int8)])
+        self.spawned += count
+        telemetry.count("enemies_spawned", count)
+
+    def spawn_enemy(self, players):
+        """
+        Sinh một kẻ địch mới (như EnemyManager.spawn_enemy).
+        """
+        self.spawn(1, players)
+
+    def update(self, players, current_time=None):
+        """
+        Cập nhật cả đàn kẻ địch.
+        
+        Tham số:
+            players: Danh sách người chơi
+            current_time: Thời gian hiện tại (ms), mặc định lấy từ pygame
+        """
+        if current_time is None:
+            current_time = pygame.time.get_ticks()
+
+        self.check_bullets_hit(players, current_time)
+        if current_time - self.spawn_timer >= self.spawn_interval:
+            self.spawn_enemy(players)
+            self.spawn_timer = current_time
+        if not self.count:
+            return
+
+        if current_time - self.path_update_timer > self.PATH_UPDATE_INTERVAL:
+            self.retarget(players)
+            self.path_update_timer = current_time
+        self.steer(players)
+        self.move()
+        self.check_collision_with_players(players)
+
+    def sprite_states(self):
+        """
+        Lấy thông tin vẽ của các kẻ địch nằm trong màn hình; góc chỉ được tính
+        cho những kẻ địch này.
+        
+        Trả về:
+            Danh sách (uid, x, y, góc)
+        """
+        x, y = self.pos[:, 0], self.pos[:, 1]
+        visible = np.flatnonzero((x >= 0) & (x < WIDTH) & (y >= 0) & (y < HEIGHT))
+        heading = self.heading[visible]
+        angles = np.degrees(np.arctan2(-heading[:, 1], heading[:, 0]))
+        return list(zip(self.uid[visible].tolist(), x[visible].tolist(),
+                        y[visible].tolist(), angles.tolist()))
+
+    # Định dạng nhị phân dùng trong Match.save_state
+    STATE_HEADER = struct.Struct("<ddIdI")
+
+    def save_state(self, players):
+        """
+        Ghi bộ đếm và các mảng trạng thái của đàn kẻ địch ra bytes.
+        """
+        return b"".join([
+            self.STATE_HEADER.pack(self.spawn_timer, self.spawn_interval, self.max_enemies,
+                                   self.path_update_timer, self.count),
+            self.uid.tobytes(), self.pos.tobytes(), self.waypoint.tobytes(),
+            self.heading.tobytes(), self.speed.tobytes(), self.moving.tobytes(),
+            self.target.tobytes(),
+        ])
+
+    def load_state(self, data, offset, players):
+        """
+        Khôi phục đàn kẻ địch từ dữ liệu do save_state ghi.
+        
+        Trả về:
+            Vị trí ngay sau phần dữ liệu đã đọc
+        """
+        (self.spawn_timer, self.spawn_interval, self.max_enemies, self.path_update_timer,
+         count) = self.STATE_HEADER.unpack_from(data, offset)
+        offset += self.STATE_HEADER.size
+
+        def read(dtype, shape):
+            nonlocal offset
+            array_ = np.frombuffer(data, dtype=dtype, count=int(np.prod(shape)), offset=offset)
+            offset += array_.nbytes
+            return array_.reshape(shape).copy()
+
+        self.uid = read(np.int64, (count,))
+        self.pos = read(np.float64, (count, 2))
+        self.waypoint = read(np.float64, (count, 2))
+        self.heading = read(np.float64, (count, 2))
+        self.speed = read(np.float64, (count,))
+        self.moving = read(bool, (count,))
+        self.target = read(np.int8, (count,))
+        return offset
+class Bullet:
+    """
+    Lớp Bullet đại diện cho đạn trong trò chơi.
+    
+    Thuộc tính:
+        uid: Mã định danh duy nhất của viên đạn
+        x, y: Tọa độ hiện tại của đạn
+        dx, dy: Vector hướng đạn
+        creation_time: Thời điểm tạo đạn
+        lifetime: Thời gian tồn tại tối đa của đạn
+    """
+    def __init__(self, x, y, dx, dy, creation_time=None):
+        self.uid = next(entity_ids)
+        self.x = x
+        self.y = y
+        self.dx = dx
+        self.dy = dy
+        self.creation_time = time.time() if creation_time is None else creation_time
+        self.lifetime = 5.0
+
+    def move(self):
+        """
+        Di chuyển đạn theo hướng và tốc độ đã định.
+        """
+        self.x += self.dx * BULLET_SPEED
+        self.y += self.dy * BULLET_SPEED
+
+    def get_rect(self):
+        """
+        Lấy hình chữ nhật bao quanh đạn.
+        
+        Trả về:
+            Đối tượng pygame.Rect
+        """
+        return pygame.Rect(
+            self.x - BULLET_RADIUS, 
+            self.y - BULLET_RADIUS, 
+            BULLET_RADIUS * 1, 
+            BULLET_RADIUS * 1
+        )
+
+    def is_off_screen(self):
+        """
+        Kiểm tra đạn đã ra khỏi màn hình chưa.
+        
+        Trả về:
+            True nếu đạn đã ra khỏi màn hình, ngược lại False
+        """
+        return not (0 <= self.x <= WIDTH and 0 <= self.y <= HEIGHT)
+
+    def is_expired(self, current_time):
+        """
+        Kiểm tra đạn đã hết thời gian tồn tại chưa.
+        
+        Tham số:
+            current_time: Thời gian hiện tại
+            
+        Trả về:
+            True nếu đạn đã hết thời gian tồn tại, ngược lại False
+        """
+        return current_time - self.creation_time > self.lifetime
+
+    def bounce(self, wall_rect, rng=random):
+        """
+        Xử lý đạn nảy khi va chạm với tường.
+        
+        Tham số:
+            wall_rect: Hình chữ nhật của tường
+            rng: Bộ sinh số ngẫu nhiên dùng để tạo nhiễu
         """
         # Xác định va chạm và đổi hướng đạn
         bullet_rect = self.get_rect()
@@ -518,8 +1631,8 @@ class Bullet:
             self.dy *= -1
         
         # Thêm nhiễu nhỏ để tránh kẹt
-        self.dx += random.uniform(-0.05, 0.05)
-        self.dy += random.uniform(-0.05, 0.05)
+        self.dx += rng.uniform(-0.05, 0.05)
+        self.dy += rng.uniform(-0.05, 0.05)
         
         # Chuẩn hóa vector tốc độ
         magnitude = math.sqrt(self.dx * self.dx + self.dy * self.dy)
@@ -533,13 +1646,61 @@ class Wall:
     def draw(self, window):
         pygame.draw.rect(window, self.color, self.rect)
 
-    def generate_maze_walls(grid_width, grid_height):
-        walls = []
+    def merged_wall_rects(grid, geometry):
+        """
+        Gộp các ô tường liền nhau thành ít hình chữ nhật hơn: các ô tường liên
+        tiếp trên một hàng gộp thành một đoạn, rồi các đoạn trùng cột ở những
+        hàng kề nhau gộp thành một hình chữ nhật cao hơn.
+        
+        Tham số:
+            grid: Lưới mê cung (0 là ô trống, 1 là tường)
+            geometry: Đối tượng GridGeometry của mê cung
+            
+        Trả về:
+            Danh sách (x, y, rộng, cao), bắt đầu bằng bốn tường bao quanh màn hình
+        """
+        rects = [
+            [0, 0, WIDTH, 10],           # Trên
+            [0, HEIGHT-10, WIDTH, 10],   # Dưới
+            [0, 0, 10, HEIGHT],          # Trái
+            [WIDTH-10, 0, 10, HEIGHT]    # Phải
+        ]
+        open_runs = {}
+        for row in range(geometry.rows):
+            runs = {}
+            col = 0
+            while col < geometry.cols:
+                if grid[row][col] != 1:
+                    col += 1
+                    continue
+                start = col
+                while col < geometry.cols and grid[row][col] == 1:
+                    col += 1
+                rect = open_runs.pop((start, col), None)
+                if rect is None:
+                    rect = [start * geometry.cell_w, row * geometry.cell_h,
+                            (col - start) * geometry.cell_w, geometry.cell_h]
+                else:
+                    rect[3] += geometry.cell_h
+                runs[(start, col)] = rect
+            # Đoạn không còn nối tiếp ở hàng này thì đã hoàn chỉnh
+            rects.extend(open_runs.values())
+            open_runs = runs
+        rects.extend(open_runs.values())
+        return [tuple(rect) for rect in rects]
+
+    def backtrack_grid(grid_width, grid_height, rng=random):
+        """
+        Sinh lưới mê cung bằng thuật toán quay lui (recursive backtracking).
+        
+        Trả về:
+            Lưới mê cung (0 là ô trống, 1 là tường)
+        """
         grid = [[1 for _ in range(grid_width)] for _ in range(grid_height)]
 
         def recursive_backtrack(x, y):
             directions = [(0, 2), (2, 0), (0, -2), (-2, 0)]
-            random.shuffle(directions)
+            rng.shuffle(directions)
 
             for dx, dy in directions:
                 new_x, new_y = x + dx, y + dy
@@ -555,41 +1716,174 @@ class Wall:
         # Bắt đầu sinh mê cung
         grid[1][1] = 0  # Điểm bắt đầu
         recursive_backtrack(1, 1)
+        return grid
 
-        wall_width = WIDTH / grid_width + 1  # Thêm 1 pixel để chắc chắn không có khoảng trống
-        wall_height = HEIGHT / grid_height + 1
-        # Tạo tường bao quanh
-        walls.extend([
-            Wall(0, 0, WIDTH, 10),           # Trên
-            Wall(0, HEIGHT-10, WIDTH, 10),   # Dưới
-            Wall(0, 0, 10, HEIGHT),          # Trái
-            Wall(WIDTH-10, 0, 10, HEIGHT)    # Phải
-        ])
-        for row in range(grid_height):
-            for col in range(grid_width):
-                if grid[row][col] == 1:
-                    wall_x = col * (WIDTH // grid_width)
-                    wall_y = row * (HEIGHT // grid_height)
-                    wall_w = WIDTH // grid_width
-                    wall_h = HEIGHT // grid_height
-                    walls.append(Wall(wall_x, wall_y, wall_w, wall_h))
-
-        # Tạo các điểm spawn và đảm bảo không có tường ở gần điểm spawn
-        spawn_points=[]
-        for i in range(2):
-            spawn_points.append((random.randint(50,WIDTH-50),
-                                 random.randint(50,HEIGHT-50)))
-
-        # Tạo vùng an toàn xung quanh điểm spawn (gấp đôi kích thước xe tăng)
-        safe_zones = [
-            pygame.Rect(p[0] - TANK_SIZE*2, p[1] - TANK_SIZE*2, TANK_SIZE*2, TANK_SIZE*2)
-            for p in spawn_points
-        ]
+    def generate_maze_walls(grid_width, grid_height, rng=random, algorithm="backtrack"):
+        """
+        Lấy một mê cung (kèm dữ liệu dẫn xuất) từ bộ nhớ đệm MazeArtifact theo
+        hạt giống rút từ rng, và chọn hai điểm spawn cho người chơi: hai ô đủ
+        rộng cho xe tăng, đi tới nhau được và cách xa nhau (xem player_spawns).
+        
+        Trả về:
+            walls, spawn_points, artifact (MazeArtifact)
+        """
+        artifact = MazeArtifact.load(grid_width, grid_height, rng.getrandbits(32), algorithm)
+        return artifact.walls, artifact.player_spawns(rng), artifact
+
+class WallIndex:
+    """
+    Lớp WallIndex là chỉ mục không gian của tường theo ô lưới mê cung: mỗi ô giữ
+    danh sách hình chữ nhật của các tường chạm vào ô đó, để truy vấn va chạm chỉ
+    xét tường ở gần.
+    
+    Thuộc tính:
+        walls (list): Toàn bộ tường.
+        geometry (GridGeometry): Lưới dùng để chia ô.
+        cells (list): Danh sách pygame.Rect của tường chạm từng ô (hàng * số cột + cột).
+        blocks (list): Như cells nhưng cho khối 2x2 ô bắt đầu từ mỗi ô (không trùng lặp),
+            đủ cho mọi hộp nhỏ hơn một ô nên truy vấn thường chỉ là một lần tra bảng.
+    """
+    def __init__(self, walls, geometry):
+        self.walls = walls
+        self.geometry = geometry
+        cols, rows = geometry.cols, geometry.rows
+        self.cells = [[] for _ in range(cols * rows)]
+        for wall in walls:
+            rect = wall.rect
+            for cell in self.cell_range(rect.left, rect.top, rect.right - 1, rect.bottom - 1):
+                self.cells[cell].append(rect)
+        self.blocks = []
+        for row in range(rows):
+            for col in range(cols):
+                block = []
+                for cell in self.cell_range(col * geometry.cell_w, row * geometry.cell_h,
+                                            (col + 1) * geometry.cell_w, (row + 1) * geometry.cell_h):
+                    block += [rect for rect in self.cells[cell] if rect not in block]
+                self.blocks.append(block)
+
+    def cell_range(self, left, top, right, bottom):
+        """
+        Liệt kê các ô mà hộp [left, right] x [top, bottom] chạm vào.
+        """
+        geometry = self.geometry
+        col0, row0 = geometry.to_cell(left, top)
+        col1, row1 = geometry.to_cell(right, bottom)
+        return [row * geometry.cols + col
+                for row in range(row0, row1 + 1) for col in range(col0, col1 + 1)]
+
+    def query(self, rect):
+        """
+        Lấy hình chữ nhật của các tường nằm trong các ô mà rect chạm vào
+        (có thể lặp lại nếu một tường nằm trên nhiều ô).
+        """
+        geometry = self.geometry
+        cell_w, cell_h, cols = geometry.cell_w, geometry.cell_h, geometry.cols
+        col0, row0 = rect.left // cell_w, rect.top // cell_h
+        if (rect.right - 1) // cell_w - col0 <= 1 and (rect.bottom - 1) // cell_h - row0 <= 1 \
+                and 0 <= col0 < cols and 0 <= row0 < geometry.rows:
+            return self.blocks[row0 * cols + col0]
+
+        last_col, last_row = cols - 1, geometry.rows - 1
+        col0 = min(max(col0, 0), last_col)
+        col1 = min(max((rect.right - 1) // cell_w, 0), last_col)
+        row0 = min(max(row0, 0), last_row)
+        row1 = min(max((rect.bottom - 1) // cell_h, 0), last_row)
+        found = []
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                found += self.cells[row * geometry.cols + col]
+        return found
+
+class KinematicBody:
+    """
+    Lớp KinematicBody là bộ điều khiển di chuyển động học với hộp va chạm AABB
+    cố định và vị trí thực (không làm tròn giữa các frame).
+    
+    Mỗi lần di chuyển được quét (swept) lần lượt theo trục x rồi trục y: quãng
+    đường trên mỗi trục bị cắt ngắn tới vật cản đầu tiên phía trước, trục còn lại
+    vẫn đi tiếp nên xe tăng trượt dọc theo tường. Vật cản đã chồng lấn sẵn (ví dụ
+    khi vừa spawn) bị bỏ qua để không bị kẹt.
+    
+    Hộp va chạm là AABB cố định chứ không xoay theo xe tăng hay dùng hình tròn:
+    tường và xe tăng còn lại đều là pygame.Rect, nên phép quét AABB với AABB
+    dùng thẳng cạnh của Rect và pha lọc thô collidelist; hộp không đổi theo góc
+    nên đã đủ để va chạm không còn phình/co khi xe tăng quay.
+    
+    Thuộc tính:
+        x, y (float): Tâm hộp va chạm.
+        half_width, half_height (float): Nửa kích thước hộp va chạm.
+    """
+    EPSILON = 1e-6
+
+    def __init__(self, x, y, width, height):
+        self.x = float(x)
+        self.y = float(y)
+        self.half_width = width / 2
+        self.half_height = height / 2
+
+    def center(self):
+        """
+        Tâm làm tròn tới điểm ảnh, dùng để đặt pygame.Rect theo vị trí thực.
+        """
+        return round(self.x), round(self.y)
+
+    def move_and_slide(self, dx, dy, wall_index, obstacles=()):
+        """
+        Di chuyển hộp va chạm, dừng sát vật cản và trượt theo trục còn lại.
+        
+        Tham số:
+            dx, dy (float): Quãng đường muốn đi.
+            wall_index (WallIndex): Chỉ mục tường.
+            obstacles: Các pygame.Rect khác cần tránh (ví dụ xe tăng còn lại).
+            
+        Trả về:
+            Tuple (dx, dy) quãng đường đã đi thật
+        """
+        # Lọc thô bằng pygame (C): vùng quét của cả hai trục, nới rộng ra ngoài 1 điểm ảnh
+        x, y = self.x + dx / 2, self.y + dy / 2
+        half_width = self.half_width + abs(dx) / 2 + 1
+        half_height = self.half_height + abs(dy) / 2 + 1
+        swept = pygame.Rect(int(x - half_width), int(y - half_height),
+                            int(half_width * 2) + 1, int(half_height * 2) + 1)
+        nearby = wall_index.query(swept)
+        if swept.collidelist(nearby) < 0 and swept.collidelist(obstacles) < 0:
+            self.x += dx
+            self.y += dy
+            return dx, dy
+        rects = [nearby[index] for index in swept.collidelistall(nearby)]
+        rects += [obstacles[index] for index in swept.collidelistall(obstacles)]
 
-        # Loại bỏ tường tại và xung quanh điểm spawn
-        # walls = [wall for wall in walls if not any(safe_zone.colliderect(wall.rect) for safe_zone in safe_zones)]
+        if dx:
+            dx = self.sweep(dx, 0, rects)
+            self.x += dx
+        if dy:
+            dy = self.sweep(0, dy, rects)
+            self.y += dy
+        return dx, dy
 
-        return walls, spawn_points,grid
+    def sweep(self, dx, dy, rects):
+        """
+        Cắt ngắn chuyển động theo một trục (dx hoặc dy bằng 0) tới vật cản gần nhất.
+        """
+        eps = self.EPSILON
+        left, right = self.x - self.half_width, self.x + self.half_width
+        top, bottom = self.y - self.half_height, self.y + self.half_height
+        for rect in rects:
+            if dx:
+                if rect.top >= bottom - eps or rect.bottom <= top + eps:
+                    continue
+                if dx > 0 and rect.left >= right - eps:
+                    dx = min(dx, max(rect.left - right, 0.0))
+                elif dx < 0 and rect.right <= left + eps:
+                    dx = max(dx, min(rect.right - left, 0.0))
+            else:
+                if rect.left >= right - eps or rect.right <= left + eps:
+                    continue
+                if dy > 0 and rect.top >= bottom - eps:
+                    dy = min(dy, max(rect.top - bottom, 0.0))
+                elif dy < 0 and rect.bottom <= top + eps:
+                    dy = max(dy, min(rect.bottom - top, 0.0))
+        return dx or dy
 
 class Tank:
     """
@@ -602,6 +1896,7 @@ class Tank:
         image_original (pygame.Surface): Hình ảnh gốc của xe tăng.
         image (pygame.Surface): Hình ảnh hiện tại của xe tăng (đã xoay).
         rect (pygame.Rect): Hình chữ nhật biểu diễn vị trí và kích thước của xe tăng.
+        body (KinematicBody): Hộp va chạm và vị trí thực của xe tăng (rect bám theo).
         controls (dict): Các phím điều khiển của xe tăng.
         bullets (list): Danh sách các viên đạn hiện có của xe tăng.
         score (int): Điểm số hiện tại của xe tăng.
@@ -630,54 +1925,28 @@ class Tank:
             self.image_original = pygame.image.load(tank2).convert_alpha()
         self.image = self.image_original.copy()
         self.rect = self.image.get_rect(center=(x, y))
+        # Hộp va chạm cố định (không đổi theo góc xoay), vị trí tính bằng số thực
+        self.body = KinematicBody(x, y, self.rect.width, self.rect.height)
         self.controls = controls
         self.bullets = []
         self.score = 0
-        self.last_shot = 0
+        self.last_shot = -SHOOT_COOLDOWN
         self.angle = 0  # Góc quay (0 là hướng lên trên)
         self.max_bullets = 3
         self.color = color
         self.direction = 0  # Hướng di chuyển (0 là hướng lên trên)
 
-    def draw(self, window):
-        """
-        Vẽ xe tăng và các viên đạn của nó lên cửa sổ trò chơi.
-        
-        Phương thức này xoay hình ảnh xe tăng theo góc hiện tại, vẽ nòng súng
-        và hiển thị tất cả các viên đạn hiện có của xe tăng.
-        
-        Tham số:
-            window (pygame.Surface): Cửa sổ nơi xe tăng sẽ được vẽ.
-        """
-        # Xoay xe tăng theo góc hiện tại
-        self.image = pygame.transform.rotate(self.image_original, +self.angle)
-        self.rect = self.image.get_rect(center=self.rect.center)
-        
-        # Vẽ xe tăng đã xoay
-        window.blit(self.image, self.rect)
-        
-        # Vẽ nòng súng theo góc hiện tại
-        gun_length = 15
-        end_x = self.rect.centerx + gun_length * math.cos(math.radians(self.angle))
-        end_y = self.rect.centery - gun_length * math.sin(math.radians(self.angle))
-        pygame.draw.line(window, BLACK, 
-                         (self.rect.centerx, self.rect.centery), 
-                         (end_x, end_y), 3)
-        
-        # Vẽ đạn
-        for bullet in self.bullets:
-            pygame.draw.circle(window, BLACK, (int(bullet.x), int(bullet.y)), BULLET_RADIUS)
-
-    def move(self, keys_pressed, walls, other_tank):
+    def move(self, keys_pressed, wall_index, other_tank):
         """
         Di chuyển xe tăng dựa trên phím được nhấn và xử lý va chạm.
         
-        Phương thức này xử lý xoay xe tăng, tính toán vector di chuyển và kiểm tra
-        va chạm với tường và xe tăng khác trước khi thực hiện di chuyển.
+        Phương thức này xử lý xoay xe tăng, tính toán vector di chuyển rồi giao cho
+        KinematicBody: hộp va chạm cố định trượt dọc theo tường thay vì dừng hẳn,
+        và vị trí được giữ bằng số thực nên di chuyển chéo chậm không bị kẹt.
         
         Tham số:
             keys_pressed (pygame.key.ScancodeWrapper): Trạng thái hiện tại của bàn phím.
-            walls (list): Danh sách các bức tường trong trò chơi.
+            wall_index (WallIndex): Chỉ mục tường của mê cung hiện tại.
             other_tank (Tank): Xe tăng khác để kiểm tra va chạm.
         """
         # Xoay xe
@@ -687,49 +1956,16 @@ class Tank:
             self.angle -= ROTATE_SPEED
 
         # Tính toán vector di chuyển
-        movement_vector = pygame.math.Vector2(0, 0)
         if keys_pressed[self.controls["up"]]:
-            movement_vector.from_polar((VELOCITY, -self.angle))
+            speed = VELOCITY
         elif keys_pressed[self.controls["down"]]:
-            movement_vector.from_polar((VELOCITY, -self.angle + 180))
-
-        dx, dy = movement_vector.x, movement_vector.y
-
-        # Di chuyển với kiểm tra va chạm
-        if dx != 0 or dy != 0:
-            # Di chuyển theo x
-            temp_rect = self.rect.copy()
-            temp_rect.x += dx
-            collision_x = False
-            
-            for wall in walls:
-                if temp_rect.colliderect(wall.rect):
-                    dx = 0
-                    collision_x = True
-                    break
-                    
-            if temp_rect.colliderect(other_tank.rect):
-                dx = 0
-                collision_x = True
-            
-            self.rect.x += dx
-
-            # Di chuyển theo y
-            temp_rect = self.rect.copy()
-            temp_rect.y += dy
-            collision_y = False
-            
-            for wall in walls:
-                if temp_rect.colliderect(wall.rect):
-                    dy = 0
-                    collision_y = True
-                    break
-                    
-            if temp_rect.colliderect(other_tank.rect):
-                dy = 0
-                collision_y = True
-            
-            self.rect.y += dy
+            speed = -VELOCITY
+        else:
+            return
+        radians = math.radians(self.angle)
+        self.body.move_and_slide(speed * math.cos(radians), -speed * math.sin(radians),
+                                 wall_index, (other_tank.rect,))
+        self.rect.center = self.body.center()
 
     def shoot(self, current_time,shoot_sound):
         """
@@ -741,7 +1977,7 @@ class Tank:
         
         Tham số:
             current_time (float): Thời gian hiện tại để kiểm tra thời gian hồi.
-            shoot_sound (pygame.mixer.Sound): Âm thanh khi bắn đạn.
+            shoot_sound (SoundHandle): Âm thanh khi bắn đạn.
             
         Trả về:
             bool: True nếu bắn đạn thành công, False nếu không.
@@ -757,93 +1993,1482 @@ class Tank:
         dy = -math.sin(math.radians(self.angle))
         
         # Vị trí bắn đạn (từ phía trước xe tăng)
-        front_x = self.rect.centerx + (TANK_SIZE//1.5) * dx
-        front_y = self.rect.centery + (TANK_SIZE//1.5) * dy
+        front_x = self.body.x + (TANK_SIZE//1.5) * dx
+        front_y = self.body.y + (TANK_SIZE//1.5) * dy
         
-        self.bullets.append(Bullet(front_x, front_y, dx, dy))
+        self.bullets.append(Bullet(front_x, front_y, dx, dy, current_time))
+        telemetry.count("shots_fired")
         shoot_sound.play()
         self.last_shot = current_time
         
         return True
     
     def set_position(self, x, y):
-        self.rect.center = (x, y)
+        self.body.x, self.body.y = x, y
+        self.rect.center = self.body.center()
 
-def draw_start_screen(window, font):
-    """Thiết lập màn hình bắt đầu"""
-    window.fill(WHITE)
-    anh = os.path.join(base_path, "image", "tank_battle.png")
-    background_image = pygame.image.load(anh)
-    background_image = pygame.transform.scale(background_image, (WIDTH, HEIGHT))
-    window.blit(background_image, (0, 0))   
-    pygame.display.update()
-def find_valid_spawn_position(spawn_point, walls, other_tank=None):
-    """Tìm vị trí spawn hợp lệ gần điểm spawn ban đầu"""
-    x, y = spawn_point
-    
-    # Tạo một hình chữ nhật tương ứng với kích thước xe tăng
-    tank_rect = pygame.Rect(0, 0, TANK_SIZE, TANK_SIZE)
-    tank_rect.center = (x, y)
-    
-    # Kiểm tra xem vị trí ban đầu có hợp lệ không
-    is_valid = True
-    for wall in walls:
-        if tank_rect.colliderect(wall.rect):
-            is_valid = False
-            break
-    
-    if other_tank and tank_rect.colliderect(other_tank.rect):
-        is_valid = False
-    
-    if is_valid:
-        return x, y
-    
-    # Nếu vị trí ban đầu không hợp lệ, tìm vị trí gần đó
-    search_radius = TANK_SIZE
-    max_search_radius = 150  # Giới hạn phạm vi tìm kiếm
+def update_bullets(owner, opponent, walls, current_time, rng=random):
+    """
+    Cập nhật đạn của một xe tăng: di chuyển, xử lý trúng xe tăng và nảy tường.
     
-    while search_radius <= max_search_radius:
-        # Thử các vị trí xung quanh theo hình tròn
-        for angle in range(0, 360, 20):  # Mỗi 20 độ
-            rad = math.radians(angle)
-            test_x = x + search_radius * math.cos(rad)
-            test_y = y + search_radius * math.sin(rad)
-            
-            # Đảm bảo vị trí nằm trong màn hình
-            if test_x < TANK_SIZE or test_x > WIDTH - TANK_SIZE or test_y < TANK_SIZE or test_y > HEIGHT - TANK_SIZE:
-                continue
-                
-            tank_rect.center = (test_x, test_y)
-            
-            # Kiểm tra va chạm
-            is_valid = True
-            for wall in walls:
-                if tank_rect.colliderect(wall.rect):
-                    is_valid = False
-                    break
-            
-            if other_tank and tank_rect.colliderect(other_tank.rect):
-                is_valid = False
-            
-            if is_valid:
-                return test_x, test_y
+    Tham số:
+        owner (Tank): Xe tăng sở hữu các viên đạn.
+        opponent (Tank): Xe tăng đối thủ.
+        walls (list): Danh sách các bức tường trong trò chơi.
+        current_time (float): Thời gian hiện tại để kiểm tra thời gian sống của đạn.
+        rng (random.Random): Bộ sinh số ngẫu nhiên dùng khi đạn nảy.
+    """
+    for bullet in owner.bullets[:]:
+        bullet.move()
+        
+        # Kiểm tra đạn ra ngoài màn hình hoặc hết thời gian sống
+        if bullet.is_off_screen() or bullet.is_expired(current_time):
+            owner.bullets.remove(bullet)
+            continue
+        
+        # Kiểm tra va chạm với xe của chính mình (friendly fire)
+        if bullet.get_rect().colliderect(owner.rect):
+            owner.bullets.remove(bullet)
+            shot_sound.play()
+            opponent.score += 1
+            telemetry.count("friendly_fire")
+            continue
+        
+        # Kiểm tra va chạm với xe của đối thủ
+        if bullet.get_rect().colliderect(opponent.rect):
+            owner.bullets.remove(bullet)
+            shot_sound.play()
+            owner.score += 1
+            telemetry.count("tank_hits")
+            continue
+        
+        # Kiểm tra va chạm với tường
+        for wall in walls:
+            if bullet.get_rect().colliderect(wall.rect):
+                bullet.bounce(wall.rect, rng)
+                break
+
+def pack_grid(grid):
+    """
+    Nén lưới mê cung thành chuỗi bit (mỗi ô một bit, theo thứ tự hàng).
+    """
+    cells = bytearray((len(grid) * len(grid[0]) + 7) // 8)
+    index = 0
+    for row in grid:
+        for cell in row:
+            if cell:
+                cells[index >> 3] |= 1 << (index & 7)
+            index += 1
+    return bytes(cells)
+
+def unpack_grid(data, cols, rows):
+    """
+    Giải nén chuỗi bit do pack_grid tạo ra thành lưới mê cung.
+    """
+    return [[(data[(row * cols + col) >> 3] >> ((row * cols + col) & 7)) & 1
+             for col in range(cols)]
+            for row in range(rows)]
+
+MAZE_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "tank_battle", "mazes")
+MAZE_CACHE_LIMIT = 64
+MAZE_CACHE_WRITE = True   # Ghi mê cung mới tạo ra MAZE_CACHE_DIR (tắt bằng --no-maze-cache)
+
+class MazeArtifact:
+    """
+    Lớp MazeArtifact chứa một mê cung cùng mọi dữ liệu dẫn xuất từ nó, được tạo
+    một lần rồi lưu vào bộ nhớ đệm trên đĩa.
+    
+    Mê cung được xác định bởi (số cột, số hàng, hạt giống, thuật toán), hoặc bởi
+    chính lưới bit khi nhận từ save_state hay qua mạng. Lần tạo đầu tiên sinh lưới
+    và tính tường đã gộp, danh sách ô trống, bảng khoảng cách đường đi giữa mọi
+    cặp ô, bảng tầm nhìn và ảnh nền; kết quả được ghi vào một file trong
+    MAZE_CACHE_DIR. Những lần sau file được ánh xạ bộ nhớ (mmap) nên bảng khoảng
+    cách và ảnh nền được dùng trực tiếp mà không phải đọc hay tính lại.
+    
+    Thuộc tính:
+        key (str): Tên mê cung trong bộ nhớ đệm (cũng là tên file).
+        geometry (GridGeometry): Kích thước lưới và ô.
+        grid (list): Lưới mê cung (0 là ô trống, 1 là tường).
+        grid_bits (bytes): Lưới đã nén thành bit (xem pack_grid).
+        wall_rects (list): Các hình chữ nhật tường đã gộp (x, y, rộng, cao).
+        walls (list): Các đối tượng Wall tương ứng, dùng chung giữa các trận.
+        wall_index (WallIndex): Chỉ mục tường theo ô, dùng cho va chạm của xe tăng.
+        free_cells (array): Chỉ số các ô trống (hàng * số cột + cột).
+        distances: Độ dài đường đi ngắn nhất (tính theo ô, 8 hướng như Enemy.astar)
+            từ ô a tới ô b tại distances[a * số ô + b]; vô cùng nếu không tới được.
+        visible (list): Bitset các ô nhìn thấy được từ mỗi ô.
+        clearance: Biến đổi khoảng cách (distance transform) của tường lấy mẫu tại
+            tâm ô: khoảng cách L∞ (px) từ tâm mỗi ô tới tường gần nhất, 0 với ô tường.
+            Xe tăng TANK_SIZE đặt tại tâm ô không chạm tường khi giá trị >= TANK_SIZE / 2.
+        spawn_clearance (float): Ngưỡng clearance của ô spawn, xem spawn_threshold.
+        spawn_cells: Với mỗi ô, ô spawn gần nhất (-1 nếu không có).
+        spawnable (list): Các ô spawn (clearance >= spawn_clearance).
+        pixels: Điểm ảnh của ảnh nền, mỗi điểm một byte (0 là nền, 1 là tường).
+        background (pygame.Surface): Ảnh nền 8 bit tạo trực tiếp trên pixels.
+    """
+    MAGIC = b"TBMZ"
+    VERSION = 4
+    HEADER = struct.Struct("<4sHHHHH")
+    ALGORITHMS = {"backtrack": Wall.backtrack_grid}
+    # Các mê cung đã nạp trong tiến trình, theo khóa
+    loaded = {}
+    # Các luồng nền đang tạo trước mê cung (xem prefetch), theo khóa
+    pending = {}
+
+    def __init__(self, key, geometry, occupancy, wall_rects, free_cells, distances, visible,
+                 clearance, spawn_cells, pixels):
+        self.key = key
+        self.geometry = geometry
+        cols = geometry.cols
+        self.grid = [list(occupancy[row * cols:(row + 1) * cols]) for row in range(geometry.rows)]
+        self.grid_bits = pack_grid(self.grid)
+        self.wall_rects = wall_rects
+        self.walls = [Wall(*rect) for rect in wall_rects]
+        self.wall_index = WallIndex(self.walls, geometry)
+        self.free_cells = free_cells
+        self.distances = distances
+        self.visible = visible
+        self.clearance = clearance
+        self.spawn_cells = spawn_cells
+        self.spawn_clearance = self.spawn_threshold(free_cells, clearance, distances)
+        self.spawnable = [index for index in free_cells if clearance[index] >= self.spawn_clearance]
+        self.pixels = pixels
+        self.background = pygame.image.frombuffer(pixels, (WIDTH, HEIGHT), "P")
+        self.background.set_palette([WHITE, BLACK])
+
+    @classmethod
+    def load(cls, cols, rows, seed, algorithm="backtrack"):
+        """
+        Lấy mê cung sinh bởi thuật toán với hạt giống cho trước.
+        
+        Tham số:
+            cols, rows (int): Kích thước lưới.
+            seed (int): Hạt giống cho thuật toán sinh mê cung.
+            algorithm (str): Tên thuật toán trong ALGORITHMS.
+        """
+        key = f"{algorithm}-{cols}x{rows}-{seed}"
+        thread = cls.pending.pop(key, None)
+        if thread is not None:
+            # Mê cung đang được tạo trước: chờ luồng nền thay vì tạo lại
+            thread.join()
+        return cls.cached(key, cols, rows, cls.generator(cols, rows, seed, algorithm))
+
+    @classmethod
+    def prefetch(cls, cols, rows, seed, algorithm="backtrack"):
+        """
+        Tạo trước (hoặc nạp từ đĩa) một mê cung trên luồng nền, để load() sau đó
+        chỉ còn là tra bảng và không làm giật frame. Không làm gì nếu mê cung đã
+        có sẵn hoặc đang được tạo.
+        """
+        key = f"{algorithm}-{cols}x{rows}-{seed}"
+        if key in cls.loaded or key in cls.pending:
+            return
+        thread = threading.Thread(target=cls.cached, daemon=True,
+                                  args=(key, cols, rows, cls.generator(cols, rows, seed, algorithm)))
+        cls.pending[key] = thread
+        thread.start()
+
+    @classmethod
+    def generator(cls, cols, rows, seed, algorithm):
+        """
+        Hàm sinh lưới mê cung theo thuật toán và hạt giống (gọi khi cần tạo mới).
+        """
+        generate = cls.ALGORITHMS[algorithm]
+        return lambda: generate(cols, rows, random.Random(seed))
+
+    @classmethod
+    def for_grid(cls, grid_bits, cols, rows):
+        """
+        Lấy mê cung theo lưới bit (từ save_state hoặc gói tin MAZE).
+        """
+        # Chép danh sách vì luồng nền (prefetch) có thể thêm mê cung cùng lúc
+        for artifact in list(cls.loaded.values()):
+            geometry = artifact.geometry
+            if artifact.grid_bits == grid_bits and (geometry.cols, geometry.rows) == (cols, rows):
+                return artifact
+        return cls.cached(f"grid-{cols}x{rows}-{grid_bits.hex()}", cols, rows,
+                          lambda: unpack_grid(grid_bits, cols, rows))
+
+    @classmethod
+    def cached(cls, key, cols, rows, make_grid):
+        """
+        Tìm mê cung trong tiến trình, rồi trên đĩa; nếu chưa có thì tạo và lưu lại.
+        """
+        artifact = cls.loaded.pop(key, None)
+        if artifact is None:
+            geometry = GridGeometry(cols, rows, WIDTH // cols, HEIGHT // rows)
+            path = os.path.join(MAZE_CACHE_DIR, key + ".maze")
+            artifact = cls.read(key, geometry, path)
+            if artifact is None:
+                artifact = cls.build(key, geometry, make_grid())
+                if MAZE_CACHE_WRITE:
+                    artifact.write(path)
+        cls.loaded[key] = artifact
+        if len(cls.loaded) > MAZE_CACHE_LIMIT:
+            cls.loaded.pop(next(iter(cls.loaded)), None)
+        return artifact
+
+    @staticmethod
+    def spawn_threshold(free_cells, clearance, distances):
+        """
+        Chọn ngưỡng clearance cho các ô spawn: TANK_SIZE / 2 nếu có hai ô đủ rộng
+        nối với nhau, nếu không thì mức clearance lớn nhất còn có được một cặp ô
+        như vậy (mê cung nhiều ô thì hành lang hẹp hơn TANK_SIZE).
+        
+        Trả về:
+            Ngưỡng clearance (0 nếu mê cung không có hai ô trống nối với nhau)
+        """
+        cell_count = len(clearance)
+        for level in sorted({min(clearance[index], TANK_SIZE / 2) for index in free_cells},
+                            reverse=True):
+            cells = [index for index in free_cells if clearance[index] >= level]
+            if any(distances[a * cell_count + b] != math.inf
+                   for index, a in enumerate(cells) for b in cells[index + 1:]):
+                return level
+        return 0.0
+
+    @classmethod
+    def build(cls, key, geometry, grid):
+        """
+        Tính toàn bộ dữ liệu dẫn xuất từ lưới mê cung.
+        """
+        cols, rows = geometry.cols, geometry.rows
+        cell_count = cols * rows
+        occupancy = bytes(cell for row in grid for cell in row)
+        wall_rects = Wall.merged_wall_rects(grid, geometry)
+        free_cells = array("H", (index for index in range(cell_count) if not occupancy[index]))
+
+        # Khoảng cách L∞ từ tâm mỗi ô trống tới tường gần nhất (tính đúng trên các
+        # hình chữ nhật tường đã gộp, không làm tròn theo lưới điểm ảnh)
+        clearance = array("f", [0.0]) * cell_count
+        for index in free_cells:
+            x, y = geometry.to_world(index % cols, index // cols)
+            clearance[index] = min(max(rx - x, x - (rx + w), ry - y, y - (ry + h))
+                                   for rx, ry, w, h in wall_rects)
+
+        # Khoảng cách đường đi từ mỗi ô trống tới mọi ô (Dijkstra)
+        distances = array("f", [math.inf]) * (cell_count * cell_count)
+        for source in free_cells:
+            # Tính bằng số thực đầy đủ rồi mới chép vào mảng float32
+            distances[source * cell_count:(source + 1) * cell_count] = array(
+                "f", geometry.path_distances(grid, source))
+
+        # Ô spawn gần nhất cho mọi ô: loang (BFS 8 hướng) đồng thời từ các ô spawn
+        spawn_cells = array("h", [-1]) * cell_count
+        threshold = cls.spawn_threshold(free_cells, clearance, distances)
+        frontier = [index for index in free_cells if clearance[index] >= threshold]
+        for index in frontier:
+            spawn_cells[index] = index
+        while frontier:
+            next_frontier = []
+            for index in frontier:
+                col, row = index % cols, index // cols
+                for dx, dy in GridGeometry.DIRECTIONS:
+                    ncol, nrow = col + dx, row + dy
+                    neighbor = nrow * cols + ncol
+                    if 0 <= ncol < cols and 0 <= nrow < rows and spawn_cells[neighbor] < 0:
+                        spawn_cells[neighbor] = spawn_cells[index]
+                        next_frontier.append(neighbor)
+            frontier = next_frontier
+
+        # Bảng tầm nhìn đầy đủ giữa các ô trống
+        visibility = VisibilityCache(grid, geometry)
+        for index, a in enumerate(free_cells):
+            for b in free_cells[index:]:
+                visibility.line_of_sight((a % cols, a // cols), (b % cols, b // cols))
+
+        pixels = bytearray(WIDTH * HEIGHT)
+        for x, y, w, h in wall_rects:
+            for line in range(y * WIDTH + x, (y + h) * WIDTH + x, WIDTH):
+                pixels[line:line + w] = b"\x01" * w
+        return cls(key, geometry, occupancy, wall_rects, free_cells, distances,
+                   visibility.visible, clearance, spawn_cells, pixels)
+
+    def write(self, path):
+        """
+        Ghi mê cung vào file bộ nhớ đệm (ghi file tạm rồi đổi tên), và xóa bớt
+        các file cũ nhất khi số file vượt quá MAZE_CACHE_LIMIT.
+        """
+        geometry = self.geometry
+        cell_count = geometry.cols * geometry.rows
+        row_bytes = (cell_count + 7) // 8
+        parts = [
+            self.HEADER.pack(self.MAGIC, self.VERSION, geometry.cols, geometry.rows,
+                             len(self.wall_rects), len(self.free_cells)),
+            bytes(cell for row in self.grid for cell in row),
+            array("h", [value for rect in self.wall_rects for value in rect]).tobytes(),
+            self.free_cells.tobytes(),
+            bytes(self.distances),
+            b"".join(bits.to_bytes(row_bytes, "little") for bits in self.visible),
+            bytes(self.clearance),
+            bytes(self.spawn_cells),
+            bytes(self.pixels),
+        ]
+        try:
+            os.makedirs(MAZE_CACHE_DIR, exist_ok=True)
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, "wb") as file:
+                file.write(b"".join(parts))
+            os.replace(temp_path, path)
+
+            names = [name for name in os.listdir(MAZE_CACHE_DIR) if name.endswith(".maze")]
+            if len(names) > MAZE_CACHE_LIMIT:
+                paths = sorted((os.path.join(MAZE_CACHE_DIR, name) for name in names),
+                               key=os.path.getmtime)
+                for old_path in paths[:len(paths) - MAZE_CACHE_LIMIT]:
+                    os.remove(old_path)
+        except OSError:
+            pass
+
+    @classmethod
+    def read(cls, key, geometry, path):
+        """
+        Ánh xạ file bộ nhớ đệm vào bộ nhớ; trả về None nếu không có hoặc không hợp lệ.
+        """
+        try:
+            with open(path, "rb") as file:
+                buffer = memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+        except (OSError, ValueError):
+            return None
+
+        cell_count = geometry.cols * geometry.rows
+        row_bytes = (cell_count + 7) // 8
+        if len(buffer) < cls.HEADER.size:
+            return None
+        magic, version, cols, rows, wall_count, free_count = cls.HEADER.unpack_from(buffer)
+        sizes = (cell_count, wall_count * 8, free_count * 2, cell_count * cell_count * 4,
+                 cell_count * row_bytes, cell_count * 4, cell_count * 2, WIDTH * HEIGHT)
+        if ((magic, version, cols, rows) != (cls.MAGIC, cls.VERSION, geometry.cols, geometry.rows)
+                or len(buffer) != cls.HEADER.size + sum(sizes)):
+            return None
+
+        sections = []
+        offset = cls.HEADER.size
+        for size in sizes:
+            sections.append(buffer[offset:offset + size])
+            offset += size
+        occupancy, rects, free_cells, distances, visible, clearance, spawn_cells, pixels = sections
+        rects = rects.cast("h")
+        wall_rects = [tuple(rects[index:index + 4]) for index in range(0, len(rects), 4)]
+        visible = [int.from_bytes(visible[index:index + row_bytes], "little")
+                   for index in range(0, len(visible), row_bytes)]
+        return cls(key, geometry, occupancy, wall_rects, array("H", free_cells.cast("H")),
+                   distances.cast("f"), visible, clearance.cast("f"), spawn_cells.cast("h"), pixels)
+
+    def spawn_point_near(self, x, y):
+        """
+        Tìm ô spawn gần (x, y) nhất (một lần tra spawn_cells).
+        
+        Trả về:
+            Tâm ô (x, y), hoặc None nếu mê cung không có ô spawn nào
+        """
+        geometry = self.geometry
+        col, row = geometry.to_cell(x, y)
+        index = self.spawn_cells[row * geometry.cols + col]
+        if index < 0:
+            return None
+        return geometry.to_world(index % geometry.cols, index // geometry.cols)
+
+    def player_spawns(self, rng=random, spread=0.75):
+        """
+        Chọn điểm spawn cho hai người chơi: hai ô spawn có đường đi tới nhau, và
+        khoảng cách đường đi ít nhất bằng spread lần cặp xa nhau nhất, để không bên
+        nào xuất hiện sát đối thủ. Bên nhận ô nào cũng chọn ngẫu nhiên.
+        
+        Trả về:
+            Danh sách hai điểm (x, y)
+        
+        Ngoại lệ:
+            ValueError: Mê cung không có hai ô trống nối với nhau.
+        """
+        cell_count = len(self.spawn_cells)
+        pairs = []
+        for index, a in enumerate(self.spawnable):
+            row = a * cell_count
+            for b in self.spawnable[index + 1:]:
+                if self.distances[row + b] != math.inf:
+                    pairs.append((self.distances[row + b], a, b))
+        if not pairs:
+            raise ValueError(f"Mê cung {self.geometry.cols}x{self.geometry.rows} không có "
+                             "hai ô trống nối với nhau để đặt xe tăng")
+
+        longest = max(pairs)[0]
+        _, a, b = rng.choice([pair for pair in pairs if pair[0] >= spread * longest])
+        if rng.random() < 0.5:
+            a, b = b, a
+        cols = self.geometry.cols
+        return [self.geometry.to_world(a % cols, a // cols), self.geometry.to_world(b % cols, b // cols)]
+
+    def visibility_cache(self):
+        """
+        Tạo VisibilityCache đã điền sẵn toàn bộ bảng tầm nhìn của mê cung.
+        """
+        visibility = VisibilityCache(self.grid, self.geometry)
+        full = (1 << len(visibility.known)) - 1
+        visibility.known = [full] * len(visibility.known)
+        visibility.visible = list(self.visible)
+        return visibility
+
+class NullFrameTimer:
+    """
+    Bộ đo thời gian rỗng: Match gọi mark() sau mỗi hệ thống con, mặc định không làm gì.
+    """
+    def start(self):
+        pass
+
+    def mark(self, name):
+        pass
+
+class FrameTimer:
+    """
+    Lớp FrameTimer ghi thời gian từng hệ thống con trong mỗi frame (dùng cho chế độ stress).
+    
+    Gọi start() ở đầu frame, sau đó mark(tên) ngay sau mỗi hệ thống con: thời
+    gian từ lần đánh dấu trước được cộng vào mẫu của frame hiện tại.
+    
+    Thuộc tính:
+        samples (dict): Thời gian (giây) của từng hệ thống con theo frame {tên: [giây]}.
+        frames (list): Tổng thời gian của từng frame (giây).
+    """
+    def __init__(self):
+        self.samples = {}
+        self.frames = []
+        self.frame_start = 0.0
+        self.last = 0.0
+
+    def start(self):
+        self.frame_start = self.last = time.perf_counter()
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.samples.setdefault(name, []).append(now - self.last)
+        self.last = now
+
+    def end(self):
+        """
+        Kết thúc frame, trả về tổng thời gian frame (giây).
+        """
+        elapsed = self.last - self.frame_start
+        self.frames.append(elapsed)
+        return elapsed
+
+    def clear(self):
+        self.samples = {}
+        self.frames = []
+
+def percentile(values, fraction):
+    """
+    Phân vị của một danh sách giá trị đã sắp xếp (lấy theo thứ hạng gần nhất).
+    """
+    if not values:
+        return 0.0
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+class Match:
+    """
+    Trạng thái của một trận đấu: mê cung, hai xe tăng, kẻ địch và điểm số.
+    
+    Mỗi trận có bộ sinh số ngẫu nhiên và đồng hồ mô phỏng riêng (tăng 1/FPS giây
+    mỗi tick), nên nhiều trận có thể chạy xen kẽ trong cùng một tiến trình mà
+    không ảnh hưởng lẫn nhau.
+    
+    Thuộc tính:
+        rng (random.Random): Bộ sinh số ngẫu nhiên của trận.
+        time (float): Đồng hồ mô phỏng của trận (giây).
+        tick (int): Số tick đã mô phỏng.
+        player1, player2 (Tank): Hai xe tăng.
+        walls, grid, geometry: Mê cung hiện tại.
+        maze (MazeArtifact): Mê cung hiện tại kèm dữ liệu dẫn xuất.
+        grid_bits (bytes): Lưới mê cung đã nén thành bit (xem pack_grid).
+        enemy_manager (EnemyManager | EnemySwarm): Bộ quản lý kẻ địch.
+        swarm (bool): Trận đấu dùng EnemySwarm thay cho EnemyManager.
+        game_over (bool): Trận đấu đã kết thúc chưa.
+        winner (str): Tên người thắng.
+        maze_size (tuple): Số cột và số hàng của mê cung.
+        timer (NullFrameTimer | FrameTimer): Đo thời gian từng hệ thống con trong step().
+    """
+    timer = NullFrameTimer()
+
+    def __init__(self, seed=None, swarm=False, maze_size=(MAZE_COLS, MAZE_ROWS)):
+        """
+        Khởi tạo trận đấu mới.
+        
+        Tham số:
+            seed: Hạt giống cho bộ sinh số ngẫu nhiên (None để lấy ngẫu nhiên).
+            swarm (bool): Dùng EnemySwarm (cần NumPy) thay cho EnemyManager.
+            maze_size (tuple): Số cột và số hàng của mê cung.
+        
+        Ngoại lệ:
+            ValueError: Ô của mê cung quá hẹp để đặt xe tăng mà không chạm tường.
+        """
+        self.rng = random.Random(seed)
+        self.swarm = swarm
+        self.maze_size = maze_size
+        self.time = 0.0
+        self.tick = 0
+        self.player1 = Tank(100, 100, GREEN, PLAYER1_CONTROLS)
+        self.player2 = Tank(600, 400, RED, PLAYER2_CONTROLS)
+        self.players = [self.player1, self.player2]
+        self.game_over = False
+        self.winner = ""
+        self.new_maze()
+        if self.maze.spawn_clearance < max(self.player1.rect.size) / 2:
+            raise ValueError(f"Mê cung {maze_size[0]}x{maze_size[1]} quá hẹp để đặt xe tăng")
+        self.player1.angle = 0  # Hướng lên trên
+        self.player2.angle = 180  # Hướng xuống dưới
+
+    def new_maze(self):
+        """
+        Tạo mê cung mới, bộ quản lý kẻ địch mới và đặt lại vị trí xe tăng.
+        """
+        self.walls, spawn_points, self.maze = Wall.generate_maze_walls(
+            self.maze_size[0], self.maze_size[1], self.rng)
+        self.grid, self.geometry = self.maze.grid, self.maze.geometry
+        self.grid_bits = self.maze.grid_bits
+        self.enemy_manager = self.create_enemy_manager()
+        # Bộ đếm sinh kẻ địch tính theo đồng hồ của trận
+        self.enemy_manager.spawn_timer = self.time * 1000
+        
+        # Đặt player1 vào vị trí spawn hợp lệ
+        x1, y1 = find_valid_spawn_position(spawn_points[0], self.maze)
+        self.player1.set_position(x1, y1)
+        
+        # Đặt player2 vào vị trí spawn hợp lệ, đảm bảo không đụng player1
+        x2, y2 = find_valid_spawn_position(spawn_points[1], self.maze, self.player1)
+        self.player2.set_position(x2, y2)
+
+    def create_enemy_manager(self):
+        """
+        Tạo bộ quản lý kẻ địch cho mê cung hiện tại.
+        """
+        manager_class = EnemySwarm if self.swarm else EnemyManager
+        return manager_class(self.grid, self.geometry, self.rng, self.maze)
+
+    def restart(self):
+        """
+        Khởi động lại trận đấu: xóa điểm, đạn, kẻ địch, đặt lại đồng hồ và tạo bản đồ mới.
+        """
+        for player in self.players:
+            player.score = 0
+            player.bullets.clear()
+            player.last_shot = -SHOOT_COOLDOWN
+        self.time = 0.0
+        self.game_over = False
+        self.winner = ""
+        self.new_maze()
+
+    def prefetch_next_maze(self):
+        """
+        Tạo trước trên luồng nền mê cung mà restart() sẽ dùng. Chỉ gọi khi trận đã
+        kết thúc: lúc đó rng không còn thay đổi nên hạt giống mê cung tiếp theo
+        đã biết (restart rút nó đầu tiên, xem Wall.generate_maze_walls).
+        """
+        rng = random.Random()
+        rng.setstate(self.rng.getstate())
+        MazeArtifact.prefetch(self.maze_size[0], self.maze_size[1], rng.getrandbits(32))
+
+    # Định dạng nhị phân của trạng thái trận đấu (xem save_state)
+    STATE_HEADER = struct.Struct("<IdBBBBB")
+    STATE_TANK = struct.Struct("<ddddiIH")
+    STATE_BULLET = struct.Struct("<Qdddddd")
+    STATE_RNG = struct.Struct("<iBd")
+    RNG_WORDS = 625
+
+    def save_state(self):
+        """
+        Ghi toàn bộ trạng thái trận đấu ra một bộ đệm nhị phân phẳng.
+        
+        Bộ đệm gồm: đồng hồ và trạng thái trận, bộ đếm sinh kẻ địch, hai xe tăng
+        cùng đạn của chúng, các kẻ địch (kèm đường đi và bộ đếm thời gian), lưới
+        mê cung dạng bit và trạng thái bộ sinh số ngẫu nhiên. Dùng struct thay cho
+        pickle để chỉ mất vài chục micro giây, phù hợp cho rollback, nhân bản
+        trạng thái để AI nhìn trước và đặt lại nhanh khi chạy hàng loạt.
+        
+        Trả về:
+            bytes: Trạng thái đã tuần tự hóa.
+        """
+        geometry = self.geometry
+        winner = ("", "Player 1", "Player 2").index(self.winner)
+        parts = [self.STATE_HEADER.pack(self.tick, self.time, self.game_over, winner,
+                                        geometry.cols, geometry.rows, self.swarm)]
+        for tank in self.players:
+            parts.append(self.STATE_TANK.pack(tank.body.x, tank.body.y, tank.angle,
+                                              tank.last_shot, tank.score, tank.max_bullets,
+                                              len(tank.bullets)))
+            for bullet in tank.bullets:
+                parts.append(self.STATE_BULLET.pack(bullet.uid, bullet.x, bullet.y, bullet.dx,
+                                                    bullet.dy, bullet.creation_time, bullet.lifetime))
+        parts.append(self.grid_bits)
+        parts.append(self.enemy_manager.save_state(self.players))
+
+        version, words, gauss = self.rng.getstate()
+        parts.append(self.STATE_RNG.pack(version, gauss is not None, gauss or 0.0))
+        parts.append(array("I", words).tobytes())
+        return b"".join(parts)
+
+    def load_state(self, data):
+        """
+        Khôi phục trạng thái trận đấu từ bộ đệm do save_state tạo ra.
         
-        search_radius += TANK_SIZE
+        Hình ảnh xe tăng và âm thanh không được nạp lại; mê cung chỉ được dựng lại
+        khi lưới trong bộ đệm khác lưới hiện tại. Đạn có cùng mã được dùng lại
+        thay vì tạo mới; kẻ địch do bộ quản lý kẻ địch tự khôi phục.
+        
+        Tham số:
+            data (bytes): Trạng thái đã tuần tự hóa.
+        """
+        (self.tick, self.time, game_over, winner, cols, rows,
+         swarm) = self.STATE_HEADER.unpack_from(data)
+        self.game_over = bool(game_over)
+        self.winner = ("", "Player 1", "Player 2")[winner]
+        offset = self.STATE_HEADER.size
+
+        for tank in self.players:
+            (x, y, tank.angle, tank.last_shot, tank.score, tank.max_bullets,
+             bullet_count) = self.STATE_TANK.unpack_from(data, offset)
+            offset += self.STATE_TANK.size
+            tank.set_position(x, y)
+            existing = {bullet.uid: bullet for bullet in tank.bullets}
+            bullets = []
+            for _ in range(bullet_count):
+                uid, x, y, dx, dy, creation_time, lifetime = self.STATE_BULLET.unpack_from(data, offset)
+                offset += self.STATE_BULLET.size
+                bullet = existing.get(uid) or Bullet(x, y, dx, dy, creation_time)
+                bullet.uid, bullet.x, bullet.y, bullet.dx, bullet.dy = uid, x, y, dx, dy
+                bullet.creation_time, bullet.lifetime = creation_time, lifetime
+                bullets.append(bullet)
+            tank.bullets[:] = bullets
+
+        cell_bytes = (cols * rows + 7) // 8
+        cells = bytes(data[offset:offset + cell_bytes])
+        offset += cell_bytes
+        if cells != self.grid_bits or bool(swarm) != self.swarm:
+            # Lưới khác mê cung hiện tại: lấy mê cung tương ứng và dữ liệu dẫn đường
+            self.maze = MazeArtifact.for_grid(bytes(cells), cols, rows)
+            self.grid, self.geometry = self.maze.grid, self.maze.geometry
+            self.grid_bits = self.maze.grid_bits
+            self.maze_size = (cols, rows)
+            self.walls = self.maze.walls
+            self.swarm = bool(swarm)
+            self.enemy_manager = self.create_enemy_manager()
+        offset = self.enemy_manager.load_state(data, offset, self.players)
+
+        version, has_gauss, gauss = self.STATE_RNG.unpack_from(data, offset)
+        offset += self.STATE_RNG.size
+        words = array("I")
+        words.frombytes(data[offset:offset + self.RNG_WORDS * words.itemsize])
+        self.rng.setstate((version, tuple(words), gauss if has_gauss else None))
+
+    def step(self, keys_pressed):
+        """
+        Thực hiện một tick mô phỏng (không vẽ gì lên màn hình).
+        
+        Tham số:
+            keys_pressed: Trạng thái phím, tra cứu theo phím điều khiển của từng xe tăng.
+        """
+        self.tick += 1
+        if self.game_over:
+            return
+        self.time += 1.0 / FPS
+        current_time = self.time
+        player1, player2 = self.player1, self.player2
+
+        timer = self.timer
+        player1.move(keys_pressed, self.maze.wall_index, player2)
+        player2.move(keys_pressed, self.maze.wall_index, player1)
+        timer.mark("tanks")
+        self.enemy_manager.update(self.players, current_time * 1000)
+        timer.mark("enemies")
+
+        # Xử lý bắn
+        if keys_pressed[player1.controls["shoot"]]:
+            player1.shoot(current_time, gun_sound)
+        if keys_pressed[player2.controls["shoot"]]:
+            player2.shoot(current_time, gun_sound)
+
+        update_bullets(player1, player2, self.walls, current_time, self.rng)
+        update_bullets(player2, player1, self.walls, current_time, self.rng)
+        timer.mark("bullets")
+
+        # Kiểm tra điều kiện thắng
+        if player1.score >= MAX_SCORE or player2.score >= MAX_SCORE:
+            self.winner = "Player 1" if player1.score >= MAX_SCORE else "Player 2"
+            self.game_over = True
+            manager = self.enemy_manager
+            telemetry.count("matches_finished")
+            telemetry.observe("match_duration_seconds", self.time)
+            telemetry.event("match_end", duration=self.time, winner=self.winner,
+                            score=[player1.score, player2.score],
+                            enemies_spawned=manager.spawned, enemies_killed=manager.killed)
+
+class MatchHost:
+    """
+    Chạy nhiều trận đấu độc lập trong cùng một tiến trình, xen kẽ trên một vòng tick.
+    
+    Mỗi trận được đăng ký kèm một hàm điều khiển trả về trạng thái phím cho
+    tick tiếp theo (hoặc None để bỏ qua tick, ví dụ khi còn chờ người chơi).
+    
+    Thuộc tính:
+        entries (list): Các cặp (Match, hàm điều khiển).
+    """
+    def __init__(self):
+        self.entries = []
+
+    def add(self, match, controller):
+        """
+        Thêm một trận đấu vào host.
+        
+        Tham số:
+            match (Match): Trận đấu.
+            controller: Hàm nhận Match và trả về trạng thái phím hoặc None.
+        """
+        self.entries.append((match, controller))
+        return match
+
+    def remove(self, match):
+        """
+        Gỡ một trận đấu khỏi host.
+        """
+        self.entries = [entry for entry in self.entries if entry[0] is not match]
+
+    def tick(self):
+        """
+        Mô phỏng một tick cho tất cả các trận đấu.
+        """
+        for match, controller in self.entries:
+            keys_pressed = controller(match)
+            if keys_pressed is not None:
+                match.step(keys_pressed)
+
+def random_controller(seed=None):
+    """
+    Tạo hàm điều khiển giả lập: nhấn phím ngẫu nhiên cho cả hai xe tăng,
+    đổi phím khoảng 3 lần mỗi giây. Dùng để đo tải khi không có người chơi.
+    """
+    rng = random.Random(seed)
+    keys_pressed = {}
+
+    def controller(match):
+        if match.game_over:
+            match.restart()
+        if not keys_pressed or rng.random() < 0.05:
+            for player in match.players:
+                for key in player.controls.values():
+                    keys_pressed[key] = rng.random() < 0.3
+        return keys_pressed
+    return controller
+
+def run_host_benchmark(match_count, seconds):
+    """
+    Đo số trận đấu mỗi lõi CPU có thể chạy ở FPS tick/giây.
     
-    # Nếu không tìm thấy vị trí hợp lệ, trả về vị trí mặc định an toàn
-    safe_positions = [(WIDTH // 4, HEIGHT // 4), (WIDTH * 3 // 4, HEIGHT * 3 // 4)]
-    return random.choice(safe_positions)
+    Tham số:
+        match_count (int): Số trận chạy đồng thời.
+        seconds (float): Thời gian đo (giây).
+    """
+    host = MatchHost()
+    for seed in range(match_count):
+        host.add(Match(seed), random_controller(seed))
+
+    ticks = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        host.tick()
+        ticks += 1
+    elapsed = time.perf_counter() - start
+
+    tick_ms = elapsed / ticks * 1000
+    matches_per_core = match_count * (ticks / elapsed) / FPS
+    print(f"{match_count} matches: {ticks / elapsed:.1f} host ticks/s, {tick_ms:.2f} ms per tick")
+    print(f"~{matches_per_core:.0f} matches per core at {FPS} ticks/s")
 
-def main():
+class MonteCarloAI:
+    """
+    Lớp MonteCarloAI điều khiển một xe tăng bằng cách mô phỏng thử nhiều tương lai
+    ngắn (rollout) của trận đấu cho từng hành động và chọn hành động tốt nhất.
+    
+    Trạng thái trận đấu được chụp bằng Match.save_state và nạp vào một trận đấu
+    nháp riêng cho mỗi rollout, nên mọi luật của trò chơi (kể cả đạn nảy tường
+    và kẻ địch) đều được mô phỏng đúng. Việc mô phỏng được chia nhỏ theo frame:
+    mỗi frame chỉ dùng tối đa time_budget giây, và hành động được chọn lại sau
+    mỗi ACTION_REPEAT frame dựa trên kết quả tích lũy của các frame đó.
+    
+    Thuộc tính:
+        tank_index (int): Xe tăng được điều khiển (0 hoặc 1).
+        time_budget (float): Thời gian mô phỏng tối đa mỗi frame (giây).
+        horizon (int): Số tick mô phỏng của mỗi rollout.
+        scratch (Match): Trận đấu nháp dùng cho rollout.
+        action (int): Hành động đang thực hiện (chỉ số trong ACTIONS).
+        stats (list): Tổng điểm và số rollout của từng hành động trong lượt hiện tại.
+        last_ticks (int): Số tick đã mô phỏng cho lần chọn hành động gần nhất.
+        rollout_time (float): Thời gian trung bình của một rollout (giây).
+    """
+    ACTIONS = (
+        (), ("up",), ("down",), ("left",), ("right",),
+        ("up", "left"), ("up", "right"),
+        ("shoot",), ("up", "shoot"), ("left", "shoot"), ("right", "shoot"),
+    )
+    ACTION_REPEAT = 6
+
+    def __init__(self, tank_index=1, time_budget=0.008, horizon=40, seed=None):
+        self.tank_index = tank_index
+        self.time_budget = time_budget
+        self.horizon = horizon
+        self.rng = random.Random(seed)
+        self.scratch = Match(seed)
+        self.action = 0
+        self.frames = 0
+        self.base = None
+        self.stats = [[0.0, 0] for _ in self.ACTIONS]
+        self.last_ticks = 0
+        self.ticks = 0
+        self.rollout_time = 0.0
+
+    def action_keys(self, action, controls):
+        """
+        Chuyển hành động thành trạng thái phím của xe tăng được điều khiển.
+        """
+        names = self.ACTIONS[action]
+        return {key: name in names for name, key in controls.items()}
+
+    def evaluate(self, match):
+        """
+        Đánh giá trạng thái cuối rollout theo góc nhìn của xe tăng được điều khiển:
+        chênh lệch điểm là chính, cộng thêm một chút cho việc quay nòng về phía đối thủ.
+        """
+        own = match.players[self.tank_index]
+        other = match.players[1 - self.tank_index]
+        value = own.score - other.score
+        dx = other.rect.centerx - own.rect.centerx
+        dy = own.rect.centery - other.rect.centery
+        distance = math.hypot(dx, dy)
+        if distance > 0:
+            facing = (math.cos(math.radians(own.angle)) * dx + math.sin(math.radians(own.angle)) * dy)
+            value += 0.05 * facing / distance
+        return value
+
+    def rollout(self, action, opponent_keys):
+        """
+        Mô phỏng một tương lai ngắn bắt đầu bằng hành động cho trước.
+        
+        Trả về:
+            float: Giá trị của trạng thái cuối so với trạng thái ban đầu.
+        """
+        scratch = self.scratch
+        scratch.load_state(self.base)
+        # Mỗi rollout có nhiễu ngẫu nhiên riêng (đạn nảy, kẻ địch sinh ra)
+        scratch.rng.seed(self.rng.getrandbits(32))
+        own = scratch.players[self.tank_index]
+        keys_pressed = dict(opponent_keys)
+        keys_pressed.update(self.action_keys(action, own.controls))
+        start_value = self.evaluate(scratch)
+        for tick in range(self.horizon):
+            scratch.step(keys_pressed)
+            if scratch.game_over:
+                break
+        self.ticks += tick + 1
+        return self.evaluate(scratch) - start_value
+
+    def plan(self, opponent_keys):
+        """
+        Chạy các rollout (lần lượt cho từng hành động) cho tới khi hết thời gian của frame.
+        """
+        deadline = time.perf_counter() + self.time_budget
+        muted, audio.muted = audio.muted, True
+        telemetry_muted, telemetry.muted = telemetry.muted, True
+        try:
+            # Mỗi frame chạy ít nhất một rollout; các rollout sau chỉ bắt đầu
+            # nếu dự kiến xong trước hạn của frame
+            first = True
+            while first or time.perf_counter() + self.rollout_time < deadline:
+                first = False
+                start = time.perf_counter()
+                action = min(range(len(self.ACTIONS)), key=lambda a: self.stats[a][1])
+                value = self.rollout(action, opponent_keys)
+                self.stats[action][0] += value
+                self.stats[action][1] += 1
+                self.rollout_time = 0.8 * self.rollout_time + 0.2 * (time.perf_counter() - start)
+        finally:
+            audio.muted = muted
+            telemetry.muted = telemetry_muted
+
+    def control(self, match, keys_pressed):
+        """
+        Tính phím cho frame hiện tại.
+        
+        Tham số:
+            match (Match): Trận đấu thật.
+            keys_pressed: Trạng thái bàn phím hiện tại (dùng làm dự đoán hành vi của đối thủ).
+            
+        Trả về:
+            dict: Trạng thái phím của cả hai xe tăng.
+        """
+        opponent = match.players[1 - self.tank_index]
+        opponent_keys = {key: bool(keys_pressed[key]) for key in opponent.controls.values()}
+        if self.base is None:
+            self.base = match.save_state()
+
+        self.plan(opponent_keys)
+        self.frames += 1
+        if self.frames >= self.ACTION_REPEAT:
+            # Chọn hành động có giá trị trung bình cao nhất rồi bắt đầu lượt mới
+            self.action = max((a for a in range(len(self.ACTIONS)) if self.stats[a][1]),
+                              key=lambda a: self.stats[a][0] / self.stats[a][1],
+                              default=self.action)
+            self.last_ticks = self.ticks
+            self.ticks = 0
+            self.frames = 0
+            self.stats = [[0.0, 0] for _ in self.ACTIONS]
+            self.base = match.save_state()
+
+        keys = dict(opponent_keys)
+        keys.update(self.action_keys(self.action, match.players[self.tank_index].controls))
+        return keys
+
+def run_ai_benchmark(seconds):
+    """
+    Đo tốc độ mô phỏng qua AI: Player 2 do MonteCarloAI điều khiển, Player 1 bấm ngẫu nhiên.
+    In số tick mô phỏng cho mỗi lần chọn hành động và thời gian xử lý mỗi frame.
+    """
+    match = Match(1)
+    ai = MonteCarloAI(seed=1)
+    opponent = random_controller(2)
+    frame_times = []
+    ticks = []
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        frame_start = time.perf_counter()
+        keys = opponent(match)
+        match.step(ai.control(match, keys))
+        frame_times.append(time.perf_counter() - frame_start)
+        if ai.frames == 0:
+            ticks.append(ai.last_ticks)
+    frame_times.sort()
+    print(f"Rollout ticks per decision: mean {sum(ticks) / max(len(ticks), 1):.0f} "
+          f"({ai.ACTION_REPEAT} frames x {ai.time_budget * 1000:.0f} ms)")
+    print(f"Frame time: mean {sum(frame_times) / len(frame_times) * 1000:.2f} ms, "
+          f"p99 {frame_times[int(len(frame_times) * 0.99)] * 1000:.2f} ms")
+    print(f"Score P1 (random) {match.player1.score} : P2 (AI) {match.player2.score}")
+
+def run_swarm_benchmark(enemy_count, seconds):
+    """
+    Đo thời gian cập nhật EnemySwarm với nhiều kẻ địch trên một trận đấu,
+    hai người chơi bấm ngẫu nhiên. In thời gian mỗi tick so với ngân sách một frame.
+    """
+    match = Match(1, swarm=True)
+    manager = match.enemy_manager
+    manager.max_enemies = enemy_count
+    manager.spawn(enemy_count, match.players)
+    controller = random_controller(2)
+    update_times = []
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        keys = controller(match)
+        # Giữ số kẻ địch ổn định để đo đúng kích thước đàn
+        manager.spawn(enemy_count - manager.count, match.players)
+        tick_start = time.perf_counter()
+        match.step(keys)
+        update_times.append(time.perf_counter() - tick_start)
+        if match.game_over:
+            match.restart()
+            manager = match.enemy_manager
+            manager.max_enemies = enemy_count
+    update_times.sort()
+    mean = sum(update_times) / len(update_times) * 1000
+    print(f"{enemy_count} enemies: mean {mean:.2f} ms, "
+          f"p99 {update_times[int(len(update_times) * 0.99)] * 1000:.2f} ms per tick "
+          f"(frame budget {1000 / FPS:.1f} ms)")
+
+# Chế độ stress: mỗi bước tăng gấp đôi số kẻ địch và số đạn mỗi xe tăng, giảm
+# một nửa khoảng cách sinh kẻ địch và mở rộng mê cung (lớn hơn 21x15 thì hành
+# lang hẹp hơn TANK_SIZE, xem MazeArtifact.spawn_threshold)
+STRESS_MAZE_SIZES = ((15, 10), (17, 12), (19, 13), (21, 15))
+STRESS_WARMUP_FRAMES = FPS
+STRESS_MEASURE_FRAMES = 2 * FPS
+STRESS_SUSTAINED_FRAMES = FPS // 2  # Dừng đo sớm khi số frame liên tiếp vượt ngân sách đạt mức này
+STRESS_PERCENTILE = 0.95
+STRESS_SUBSYSTEMS = ("tanks", "enemies", "bullets", "audio", "render", "display")
+
+def stress_level(level):
+    """
+    Thông số tải ở bước thứ level của chế độ stress.
+    
+    Trả về:
+        dict: Số kẻ địch tối đa, số đạn tối đa mỗi xe tăng, khoảng cách sinh kẻ địch (ms)
+        và kích thước mê cung.
+    """
+    return {"enemies": 10 << level, "bullets": 3 << level,
+            "spawn_interval": max(5000 >> level, 1000 // FPS),
+            "maze": STRESS_MAZE_SIZES[min(level, len(STRESS_MAZE_SIZES) - 1)]}
+
+def run_stress_test(window, font, swarm=False, max_levels=12):
+    """
+    Tăng dần tải (kẻ địch, tốc độ sinh, đạn, kích thước mê cung) cho tới khi
+    vượt ngân sách một frame, rồi in báo cáo sức chứa.
+    
+    Mỗi bước chạy một trận mới có sẵn đủ kẻ địch, hai xe tăng chạy ngẫu nhiên và
+    bắn liên tục (bỏ qua thời gian hồi, trận không bao giờ kết thúc). Thời gian từng
+    hệ thống con (mô phỏng, âm thanh, vẽ, cập nhật màn hình) được đo mỗi frame,
+    không chờ clock.tick, và chỉ sau STRESS_WARMUP_FRAMES frame khởi động. Một
+    bước không đạt khi phân vị STRESS_PERCENTILE của thời gian frame vượt 1/FPS
+    giây (hoặc sớm hơn, khi STRESS_SUSTAINED_FRAMES frame đo liên tiếp vượt);
+    khi đó dừng lại.
+    
+    Tham số:
+        window (pygame.Surface): Cửa sổ để vẽ.
+        font (pygame.font.Font): Font cho Renderer.
+        swarm (bool): Dùng EnemySwarm thay cho EnemyManager.
+        max_levels (int): Số bước tối đa.
+        
+    Trả về:
+        list: Kết quả từng bước (dict), bước cuối là bước vượt ngân sách (nếu có).
+    """
+    budget = 1.0 / FPS
+    renderer = Renderer(window, font)
+    controller = random_controller(1)
+    timer = FrameTimer()
+    results = []
+    print(f"Stress test on {platform.platform()}, Python {platform.python_version()}, "
+          f"pygame {pygame.version.ver}, {'EnemySwarm' if swarm else 'EnemyManager'}")
+    print(f"{'level':>5} {'enemies':>8} {'bullets':>8} {'maze':>6} {'spawn':>6} "
+          f"{'p50':>6} {'p95':>6} {'p99':>6}  p95 per subsystem (ms)")
+
+    for level in range(max_levels):
+        params = stress_level(level)
+        match = Match(level, swarm=swarm, maze_size=params["maze"])
+        match.timer = timer
+        manager = match.enemy_manager
+        manager.max_enemies = params["enemies"]
+        manager.spawn_interval = params["spawn_interval"]
+        for player in match.players:
+            player.max_bullets = params["bullets"]
+        # Sinh sẵn đủ kẻ địch để đo ngay ở mức tải ổn định
+        if swarm:
+            manager.spawn(params["enemies"], match.players)
+        else:
+            for _ in range(params["enemies"]):
+                manager.spawn_enemy(match.players)
+
+        for frame in range(STRESS_WARMUP_FRAMES + STRESS_MEASURE_FRAMES):
+            if frame == STRESS_WARMUP_FRAMES:
+                timer.clear()
+                enemy_counts, bullet_counts = [], []
+                over_budget = 0
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    return results
+            keys_pressed = controller(match)
+            for player in match.players:
+                keys_pressed[player.controls["shoot"]] = True
+                player.last_shot = -SHOOT_COOLDOWN
+                player.score = 0
+
+            timer.start()
+            match.step(keys_pressed)
+            audio.flush()
+            timer.mark("audio")
+            dirty = renderer.draw(match)
+            timer.mark("render")
+            pygame.display.update(dirty)
+            timer.mark("display")
+            elapsed = timer.end()
+            # Nhiều kẻ địch có thể cùng chạm xe tăng trong một tick và kết thúc trận
+            match.game_over = False
+            if frame < STRESS_WARMUP_FRAMES:
+                continue
+
+            over_budget = over_budget + 1 if elapsed > budget else 0
+            enemy_counts.append(manager.count)
+            bullet_counts.append(sum(len(player.bullets) for player in match.players))
+            if over_budget >= STRESS_SUSTAINED_FRAMES:
+                break
+
+        frames = sorted(timer.frames)
+        result = dict(level=level, max_enemies=params["enemies"], max_bullets=params["bullets"],
+                      spawn_interval=params["spawn_interval"], maze=list(params["maze"]),
+                      enemies=round(sum(enemy_counts) / len(enemy_counts)),
+                      bullets=round(sum(bullet_counts) / len(bullet_counts)),
+                      p50=percentile(frames, 0.5), p95=percentile(frames, 0.95),
+                      p99=percentile(frames, 0.99),
+                      subsystems={name: percentile(sorted(timer.samples.get(name, ())), 0.95)
+                                  for name in STRESS_SUBSYSTEMS},
+                      frames=len(frames))
+        result["over_budget"] = (over_budget >= STRESS_SUSTAINED_FRAMES or
+                                 percentile(frames, STRESS_PERCENTILE) > budget)
+        results.append(result)
+        telemetry.event("stress_level", **result)
+        subsystems = " ".join(f"{name} {seconds * 1000:.2f}"
+                              for name, seconds in result["subsystems"].items())
+        print(f"{level:>5} {result['enemies']:>8} {result['bullets']:>8} "
+              f"{'%dx%d' % params['maze']:>6} {params['spawn_interval']:>6} "
+              f"{result['p50'] * 1000:>6.2f} {result['p95'] * 1000:>6.2f} "
+              f"{result['p99'] * 1000:>6.2f}  {subsystems}"
+              + ("  OVER BUDGET" if result["over_budget"] else ""))
+        if result["over_budget"]:
+            break
+
+    passed = [result for result in results if not result["over_budget"]]
+    if not passed:
+        print(f"Capacity: frame budget ({budget * 1000:.1f} ms) exceeded at the first level")
+    else:
+        best = passed[-1]
+        print(f"Capacity: {best['enemies']} enemies, {best['bullets']} bullets "
+              f"on a {best['maze'][0]}x{best['maze'][1]} maze at {FPS} FPS"
+              + ("" if len(passed) < len(results) else f" (budget not reached in {max_levels} levels)"))
+    return results
+
+FONT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "tank_battle", "fonts.json")
+
+def load_font(name, size):
+    """
+    Tải font hệ thống theo tên, lưu đường dẫn font tìm được vào file để lần chạy
+    sau không phải liệt kê lại toàn bộ font hệ thống (việc chậm nhất của SysFont).
+    
+    Tham số:
+        name (str): Tên font hệ thống, ví dụ "comicsans".
+        size (int): Cỡ chữ.
+        
+    Trả về:
+        pygame.font.Font: Font tìm được, hoặc font mặc định nếu không có.
+    """
+    try:
+        with open(FONT_CACHE_PATH, encoding="utf-8") as file:
+            cache = json.load(file)
+    except (OSError, ValueError):
+        cache = {}
+
+    path = cache.get(name)
+    if path is None or (path and not os.path.exists(path)):
+        path = pygame.font.match_font(name) or ""
+        cache[name] = path
+        try:
+            os.makedirs(os.path.dirname(FONT_CACHE_PATH), exist_ok=True)
+            with open(FONT_CACHE_PATH, "w", encoding="utf-8") as file:
+                json.dump(cache, file)
+        except OSError:
+            pass
+
+    try:
+        return pygame.font.Font(path or None, size)
+    except (OSError, pygame.error):
+        return pygame.font.Font(None, size)
+
+class TextCache:
+    """
+    Lớp TextCache lưu các hình chữ đã render để chỉ render lại khi nội dung đổi.
+    
+    Các đoạn chữ (ví dụ "P1: " và từng chữ số) được render một lần vào bảng
+    glyph; dòng chữ có số như điểm số được ghép lại từ các glyph này bằng vài
+    lệnh blit khi giá trị thay đổi.
+    
+    Thuộc tính:
+        font (pygame.font.Font): Font dùng để render.
+        color (tuple): Màu chữ.
+        glyphs (dict): Bảng glyph {đoạn chữ: hình}.
+        lines (dict): Dòng chữ đã ghép theo khóa {khóa: (nội dung, hình)}.
+    """
+    def __init__(self, font, color):
+        self.font = font
+        self.color = color
+        self.glyphs = {}
+        self.lines = {}
+        for digit in "0123456789":
+            self.glyph(digit)
+
+    def glyph(self, text):
+        """
+        Lấy hình của một đoạn chữ từ bảng glyph, render nếu chưa có.
+        """
+        image = self.glyphs.get(text)
+        if image is None:
+            image = self.font.render(text, True, self.color)
+            self.glyphs[text] = image
+        return image
+
+    def text(self, key, text):
+        """
+        Lấy hình của một dòng chữ cố định (render nguyên dòng, có lưu lại).
+        
+        Tham số:
+            key: Khóa của dòng chữ (ví dụ "winner").
+            text (str): Nội dung dòng chữ.
+        """
+        cached = self.lines.get(key)
+        if cached is None or cached[0] != text:
+            cached = (text, self.font.render(text, True, self.color))
+            self.lines[key] = cached
+        return cached[1]
+
+    def compose(self, key, segments):
+        """
+        Ghép một dòng chữ từ các đoạn trong bảng glyph; chỉ ghép lại khi nội dung đổi.
+        
+        Tham số:
+            key: Khóa của dòng chữ (ví dụ "score").
+            segments (tuple): Các đoạn chữ theo thứ tự, số nên tách thành từng chữ số.
+        """
+        cached = self.lines.get(key)
+        if cached is None or cached[0] != segments:
+            images = [self.glyph(segment) for segment in segments]
+            height = max(image.get_height() for image in images)
+            line = pygame.Surface((sum(image.get_width() for image in images), height), pygame.SRCALPHA)
+            x = 0
+            for image in images:
+                line.blit(image, (x, 0))
+                x += image.get_width()
+            cached = (segments, line)
+            self.lines[key] = cached
+        return cached[1]
+
+class Renderer:
+    """
+    Lớp Renderer vẽ trận đấu theo lô (batch) và chỉ vẽ lại những vùng thay đổi.
+    
+    Mỗi frame, mọi thực thể nhìn thấy được (kẻ địch, xe tăng, đạn, chữ) được gom
+    thành danh sách (hình, vị trí). Những thực thể đổi hình hoặc đổi vị trí so với
+    frame trước tạo ra vùng bẩn (dirty rect), gồm vị trí cũ và mới. Mỗi vùng bẩn
+    được khôi phục nền rồi vẽ lại phần của các thực thể nằm trong nó (cắt theo
+    vùng), bằng một lệnh Surface.blits. Khi vùng bẩn quá nhiều hoặc quá rộng thì
+    vẽ lại toàn bộ màn hình (như pygame.sprite.LayeredDirty). Tường được vẽ sẵn
+    vào ảnh nền, đạn và kẻ địch dùng chung hình vẽ sẵn, hình xe tăng đã xoay
+    (kèm nòng súng) được lưu lại theo màu và góc.
+    
+    Thuộc tính:
+        window (pygame.Surface): Cửa sổ trò chơi.
+        text_cache (TextCache): Bộ nhớ đệm chữ cho điểm số và màn hình game over.
+        background (pygame.Surface): Ảnh nền của mê cung hiện tại (chép từ MazeArtifact).
+        walls: Danh sách tường ứng với ảnh nền (để biết khi nào mê cung đổi).
+        sprites (dict): Các thực thể đã vẽ ở frame trước {khóa: (hình, Rect)}.
+        bullet_image (pygame.Surface): Hình đạn vẽ sẵn.
+        enemy_image (pygame.Surface): Hình kẻ địch dùng chung.
+        rotated (dict): Bộ nhớ đệm hình đã xoay theo (tên hình, góc).
+        tank_images (dict): Hình xe tăng kèm nòng súng theo màu xe tăng.
+    """
+    GUN_LENGTH = 15
+    # Vượt một trong hai ngưỡng này thì vẽ lại toàn bộ màn hình thay vì từng vùng
+    MAX_DIRTY_RECTS = 64
+    MAX_DIRTY_AREA = WIDTH * HEIGHT // 4
+
+    def __init__(self, window, font):
+        self.window = window
+        self.text_cache = TextCache(font, RED)
+        self.background = pygame.Surface(window.get_size()).convert()
+        self.walls = None
+        self.sprites = {}
+        self.rotated = {}
+
+        self.bullet_image = pygame.Surface((BULLET_RADIUS * 2 + 1, BULLET_RADIUS * 2 + 1), pygame.SRCALPHA)
+        pygame.draw.circle(self.bullet_image, BLACK, (BULLET_RADIUS, BULLET_RADIUS), BULLET_RADIUS)
+        self.enemy_image = pygame.Surface((10, 10), pygame.SRCALPHA)
+        self.enemy_image.fill(RED)
+        self.tank_images = {}
+
+    def tank_image(self, tank):
+        """
+        Lấy hình xe tăng kèm nòng súng (chưa xoay), tạo một lần cho mỗi màu xe tăng
+        (màu quyết định ảnh gốc, xem Tank).
+        """
+        key = tank.color
+        image = self.tank_images.get(key)
+        if image is None:
+            # Nòng súng dài hơn nửa thân xe nên cần khung vẽ rộng hơn ảnh gốc
+            size = max(tank.image_original.get_width(), tank.image_original.get_height(),
+                       self.GUN_LENGTH * 2 + 3)
+            image = pygame.Surface((size, size), pygame.SRCALPHA)
+            image.blit(tank.image_original, tank.image_original.get_rect(center=(size // 2, size // 2)))
+            pygame.draw.line(image, BLACK, (size // 2, size // 2),
+                             (size // 2 + self.GUN_LENGTH, size // 2), 3)
+            self.tank_images[key] = image
+        return image
+
+    def rotate(self, name, image, angle):
+        """
+        Xoay hình theo góc (làm tròn tới độ), dùng lại kết quả đã xoay trước đó.
+        
+        Tham số:
+            name: Khóa cố định của hình gốc (không dùng id() vì hình có thể bị tạo lại).
+            image (pygame.Surface): Hình gốc.
+            angle (float): Góc xoay (độ).
+        """
+        key = (name, int(round(angle)) % 360)
+        rotated = self.rotated.get(key)
+        if rotated is None:
+            rotated = pygame.transform.rotate(image, key[1])
+            self.rotated[key] = rotated
+        return rotated
+
+    def set_maze(self, match):
+        """
+        Lấy ảnh nền vẽ sẵn của mê cung mới.
+        """
+        self.walls = match.walls
+        self.background.blit(match.maze.background, (0, 0))
+
+    def collect(self, match):
+        """
+        Gom các thực thể cần vẽ theo thứ tự lớp (dưới lên trên).
+        
+        Trả về:
+            dict: {khóa: (hình, Rect)}
+        """
+        sprites = {}
+        if not match.game_over:
+            for uid, x, y, angle in match.enemy_manager.sprite_states():
+                image = self.rotate("enemy", self.enemy_image, angle)
+                sprites[("enemy", uid)] = (image, image.get_rect(center=(x, y)))
+
+        for index, tank in enumerate(match.players):
+            image = self.rotate(("tank", tank.color), self.tank_image(tank), tank.angle)
+            sprites[("tank", index)] = (image, image.get_rect(center=tank.rect.center))
+        for tank in match.players:
+            for bullet in tank.bullets:
+                rect = self.bullet_image.get_rect(center=(int(bullet.x), int(bullet.y)))
+                sprites[("bullet", bullet.uid)] = (self.bullet_image, rect)
+
+        score_text = self.text_cache.compose("score", ("P1: ", *str(match.player1.score),
+                                                       "    P2: ", *str(match.player2.score)))
+        sprites[("text", "score")] = (score_text, score_text.get_rect(midtop=(WIDTH // 2, 10)))
+        if match.game_over:
+            winner_text = self.text_cache.text("winner", f"{match.winner} Wins!")
+            restart_text = self.text_cache.text("restart", "Press R to restart")
+            sprites[("text", "winner")] = (winner_text, winner_text.get_rect(
+                midtop=(WIDTH // 2, HEIGHT // 2 - 20)))
+            sprites[("text", "restart")] = (restart_text, restart_text.get_rect(
+                midtop=(WIDTH // 2, HEIGHT // 2 + 20)))
+        return sprites
+
+    def draw(self, match):
+        """
+        Vẽ trận đấu lên cửa sổ.
+        
+        Tham số:
+            match (Match): Trận đấu cần vẽ.
+            
+        Trả về:
+            list: Các vùng đã thay đổi, truyền cho pygame.display.update.
+        """
+        sprites = self.collect(match)
+        previous = self.sprites
+        self.sprites = sprites
+
+        if match.walls is not self.walls:
+            # Mê cung mới: vẽ lại toàn bộ màn hình
+            self.set_maze(match)
+            self.window.blit(self.background, (0, 0))
+            self.window.blits(list(sprites.values()), doreturn=False)
+            return [self.window.get_rect()]
+
+        dirty = []
+        for key, (image, rect) in previous.items():
+            if key not in sprites:
+                dirty.append(rect)
+        for key, (image, rect) in sprites.items():
+            old = previous.get(key)
+            if old is None:
+                dirty.append(rect)
+            elif old[0] is not image or old[1] != rect:
+                # Vị trí cũ và mới thường chồng lên nhau (di chuyển vài điểm ảnh mỗi frame)
+                if old[1].colliderect(rect):
+                    dirty.append(old[1].union(rect))
+                else:
+                    dirty.append(old[1])
+                    dirty.append(rect)
+        if not dirty:
+            return []
+
+        if (len(dirty) > self.MAX_DIRTY_RECTS or
+                sum(rect.w * rect.h for rect in dirty) > self.MAX_DIRTY_AREA):
+            self.window.blit(self.background, (0, 0))
+            self.window.blits(list(sprites.values()), doreturn=False)
+            return [self.window.get_rect()]
+
+        # Mỗi vùng bẩn: khôi phục nền rồi vẽ phần nằm trong vùng của các thực thể
+        # chạm vào nó, theo thứ tự lớp. Vùng sau ghi đè phần chồng lên vùng trước
+        # nên mỗi điểm ảnh chỉ được vẽ một lần (vẽ chồng viền trong suốt sẽ đậm dần)
+        values = list(sprites.values())
+        rects = [rect for _, rect in values]
+        blits = []
+        for area in dirty:
+            blits.append((self.background, area, area))
+            for index in area.collidelistall(rects):
+                image, rect = values[index]
+                clip = rect.clip(area)
+                blits.append((image, clip, clip.move(-rect.x, -rect.y)))
+        self.window.blits(blits, doreturn=False)
+        return dirty
+
+def draw_start_screen(window, font):
+    """Thiết lập màn hình bắt đầu"""
+    window.fill(WHITE)
+    anh = os.path.join(base_path, "image", "tank_battle.png")
+    background_image = pygame.image.load(anh)
+    background_image = pygame.transform.scale(background_image, (WIDTH, HEIGHT))
+    window.blit(background_image, (0, 0))   
+    pygame.display.update()
+def find_valid_spawn_position(spawn_point, maze, other_tank=None):
+    """
+    Tìm vị trí spawn hợp lệ gần điểm spawn ban đầu.
+    
+    Vị trí được tra trong bảng ô spawn của mê cung (MazeArtifact.spawn_clearance)
+    nên không chồng lên tường; chỉ khi ô đó đã bị other_tank chiếm mới phải xét
+    các ô khác.
+    
+    Tham số:
+        spawn_point: Điểm (x, y) mong muốn
+        maze (MazeArtifact): Mê cung hiện tại
+        other_tank: Xe tăng đã được đặt trước (không được chồng lên)
+    """
+    point = maze.spawn_point_near(*spawn_point)
+    if point is None:
+        raise ValueError("Mê cung không có ô nào để đặt xe tăng")
+
+    tank_rect = pygame.Rect(0, 0, TANK_SIZE, TANK_SIZE)
+    tank_rect.center = point
+    if not (other_tank and tank_rect.colliderect(other_tank.rect)):
+        return point
+
+    # Ô gần nhất đã có xe tăng khác: thử các ô đủ rộng còn lại theo khoảng cách
+    cols = maze.geometry.cols
+    candidates = sorted((maze.geometry.to_world(index % cols, index // cols)
+                         for index in maze.spawnable),
+                        key=lambda p: math.hypot(p[0] - spawn_point[0], p[1] - spawn_point[1]))
+    for candidate in candidates:
+        tank_rect.center = candidate
+        if not tank_rect.colliderect(other_tank.rect):
+            return candidate
+    return point
+
+def init_headless():
+    """
+    Khởi tạo pygame không mở cửa sổ thật (Tank cần một màn hình để chuyển đổi ảnh).
+    Chỉ khởi tạo display và font; pygame.init() sẽ mở cả thiết bị âm thanh.
+    """
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    pygame.display.init()
+    pygame.font.init()
+    pygame.display.set_mode((1, 1))
+
+def main(ai=False, swarm=False, stress=False):
+    """
+    Chạy trò chơi.
+    
+    Tham số:
+        ai (bool): Player 2 do MonteCarloAI điều khiển (chế độ một người chơi).
+        swarm (bool): Dùng EnemySwarm (NumPy) cho kẻ địch.
+        stress (bool): Chạy chế độ stress (xem run_stress_test) thay cho trò chơi.
+    """
     pygame.init()
+    audio.use_mixer()
     window = pygame.display.set_mode((WIDTH, HEIGHT))
     pygame.display.set_caption("Tank Battle")
     clock = pygame.time.Clock()
     # Khởi tạo font
-    try:
-        font = pygame.font.SysFont("comicsans", 36)
-    except:
-        font = pygame.font.Font(None, 36)
+    font = load_font("comicsans", 36)
+    if stress:
+        run_stress_test(window, font, swarm)
+        telemetry.stop()
+        pygame.quit()
+        sys.exit()
 
     # Màn hình bắt đầu
     show_start_screen = True
@@ -859,166 +3484,77 @@ def main():
                 if event.key == pygame.K_SPACE:
                     show_start_screen = False
     
-    # Tạo bản đồ và điểm spawn
-    walls, spawn_points,grid = Wall.generate_maze_walls(15, 10)
-    # Tạo xe tăng với kiểm tra vị trí hợp lệ
-    player1 = Tank(100, 100, GREEN, {
-        "up": pygame.K_w, "down": pygame.K_s, 
-        "left": pygame.K_a, "right": pygame.K_d, 
-        "shoot": pygame.K_SPACE
-    })
-    enemy_manager = EnemyManager(grid, 53)
-    # Đặt player1 vào vị trí spawn hợp lệ
-    x1, y1 = find_valid_spawn_position(spawn_points[0], walls)
-    player1.set_position(x1, y1)
-    player1.angle = 0  # Hướng lên trên
-    player2 = Tank(600, 400, RED, {
-        "up": pygame.K_UP, "down": pygame.K_DOWN, 
-        "left": pygame.K_LEFT, "right": pygame.K_RIGHT, 
-        "shoot": pygame.K_RETURN
-    })
-    
-    # Đặt player2 vào vị trí spawn hợp lệ, đảm bảo không đụng player1
-    x2, y2 = find_valid_spawn_position(spawn_points[1], walls, player1)
-    player2.set_position(x2, y2)
-    player2.angle = 180  # Hướng xuống dưới
-    # Biến trạng thái game
-    player=[player1,player2]
-    game_over = False
-    winner = ""
+    # Tạo trận đấu (bản đồ, điểm spawn và xe tăng)
+    match = Match(swarm=swarm)
+    renderer = Renderer(window, font)
+    controller = MonteCarloAI() if ai else None
 
     # Vòng lặp chính
     running = True
     while running:
         clock.tick(FPS)
-        current_time = time.time()
-        window.fill(WHITE)
+        frame_start = time.perf_counter()
 
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
-            if event.type == pygame.KEYDOWN and game_over:
+            if event.type == pygame.KEYDOWN and match.game_over:
                 if event.key == pygame.K_r:
                     # Khởi động lại game
-                    player1.score = 0
-                    player2.score = 0
-                    player1.bullets.clear()
-                    player2.bullets.clear()
-                    game_over = False
-
-                    # Tạo bản đồ mới và đặt lại vị trí xe tăng
-                    walls, spawn_points,grid = Wall.generate_maze_walls(15, 10)
-                    
-                    # Đặt player1 vào vị trí spawn hợp lệ
-                    x1, y1 = find_valid_spawn_position(spawn_points[0], walls)
-                    player1.set_position(x1, y1)
-                    
-                    # Đặt player2 vào vị trí spawn hợp lệ
-                    x2, y2 = find_valid_spawn_position(spawn_points[1], walls, player1)
-                    player2.set_position(x2, y2)
+                    match.restart()
 
-        if not game_over:
+        if match.game_over:
+            # Tạo mê cung cho lần chơi lại trong lúc người chơi xem màn hình kết thúc
+            match.prefetch_next_maze()
+        else:
             keys_pressed = pygame.key.get_pressed()
-            
-            player1.move(keys_pressed, walls, player2)
-            player2.move(keys_pressed, walls, player1)
-            enemy_manager.update([player1,player2])   
-            enemy_manager.draw(window) 
-            # Xử lý bắn
-            if keys_pressed[player1.controls["shoot"]]:
-                player1.shoot(current_time,gun_sound)
-
-            if keys_pressed[player2.controls["shoot"]]:
-                player2.shoot(current_time,gun_sound)
-
-            # Quản lý đạn của player 1
-            for bullet in player1.bullets[:]:
-                bullet.move()
-                
-                # Kiểm tra đạn ra ngoài màn hình
-                if bullet.is_off_screen() or bullet.is_expired(current_time):
-                    player1.bullets.remove(bullet)
-                    continue
-                
-                # Kiểm tra va chạm với xe của player 1 (friendly fire)
-                if bullet.get_rect().colliderect(player1.rect):
-                    
-                    player1.bullets.remove(bullet)
-                    shot_sound.play()
-                    player2.score += 1
-                    continue
-                
-                # Kiểm tra va chạm với xe của player 2
-                if bullet.get_rect().colliderect(player2.rect):
-                    player1.bullets.remove(bullet)
-                    shot_sound.play()
-                    player1.score += 1
-                    continue
-                
-                # Kiểm tra va chạm với tường
-                for wall in walls:
-                    if bullet.get_rect().colliderect(wall.rect):
-                        bullet.bounce(wall.rect)
-                        break
-
-            # Quản lý đạn của player 2
-            for bullet in player2.bullets[:]:
-                bullet.move()
-                
-                # Kiểm tra đạn ra ngoài màn hình hoặc hết thời gian sống
-                if bullet.is_off_screen() or bullet.is_expired(current_time):
-                    player2.bullets.remove(bullet)
-                    continue
-                
-                # Kiểm tra va chạm với xe của player 2 (friendly fire)
-                if bullet.get_rect().colliderect(player2.rect):
-                    player2.bullets.remove(bullet)
-                    shot_sound.play()
-                    player1.score += 1
-                    continue
-                
-                # Kiểm tra va chạm với xe của player 1
-                if bullet.get_rect().colliderect(player1.rect):
-                    player2.bullets.remove(bullet)
-                    shot_sound.play()
-                    player2.score += 1
-                    continue
-                
-                # Kiểm tra va chạm với tường
-                for wall in walls:
-                    if bullet.get_rect().colliderect(wall.rect):
-                        bullet.bounce(wall.rect)
-                        break
-
-            # Kiểm tra điều kiện thắng
-            if player1.score >= MAX_SCORE or player2.score >= MAX_SCORE:
-                winner = "Player 1" if player1.score >= MAX_SCORE else "Player 2"
-                game_over = True
-
-
-        # Vẽ tường
-        for wall in walls:
-            wall.draw(window)
-
-        # Vẽ xe tăng
-        player1.draw(window)
-        player2.draw(window)
-
-        # Vẽ điểm số
-        score_text = font.render(f"P1: {player1.score}    P2: {player2.score}", True, RED)
-        window.blit(score_text, (WIDTH // 2 - score_text.get_width() // 2, 10))
-
-        # Hiển thị màn hình game over
-        if game_over:
-            winner_text = font.render(f"{winner} Wins!", True, RED)
-            restart_text = font.render("Press R to restart", True, RED)
-            window.blit(winner_text, (WIDTH // 2 - winner_text.get_width() // 2, HEIGHT // 2 - 20))
-            window.blit(restart_text, (WIDTH // 2 - restart_text.get_width() // 2, HEIGHT // 2 + 20))
+            if controller:
+                keys_pressed = controller.control(match, keys_pressed)
+            match.step(keys_pressed)
+        audio.flush()
 
-        pygame.display.update()
+        pygame.display.update(renderer.draw(match))
+        telemetry.observe("frame_seconds", time.perf_counter() - frame_start)
 
+    telemetry.stop()
     pygame.quit()
     sys.exit()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Tank Battle")
+    parser.add_argument("--ai", action="store_true",
+                        help="Player 2 do máy điều khiển (MonteCarloAI)")
+    parser.add_argument("--swarm", action="store_true",
+                        help="Dùng EnemySwarm (cần NumPy) cho kẻ địch")
+    parser.add_argument("--telemetry", metavar="PATH",
+                        help="Ghi số liệu telemetry ra file JSONL (xoay vòng)")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="Mở endpoint Prometheus tại http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--no-maze-cache", action="store_true",
+                        help="Không ghi mê cung mới tạo vào bộ nhớ đệm trên đĩa")
+    parser.add_argument("--host-bench", type=int, metavar="MATCHES",
+                        help="Đo số trận mỗi lõi CPU, không mở cửa sổ")
+    parser.add_argument("--ai-bench", action="store_true",
+                        help="Đo tốc độ rollout của MonteCarloAI, không mở cửa sổ")
+    parser.add_argument("--stress", action="store_true",
+                        help="Tăng dần tải cho tới khi vượt ngân sách frame và in báo cáo sức chứa")
+    parser.add_argument("--swarm-bench", type=int, metavar="ENEMIES",
+                        help="Đo thời gian cập nhật EnemySwarm, không mở cửa sổ")
+    args = parser.parse_args()
+    if args.no_maze_cache:
+        MAZE_CACHE_WRITE = False
+    if args.telemetry:
+        telemetry.start_jsonl(args.telemetry)
+    if args.metrics_port:
+        telemetry.serve_prometheus(args.metrics_port)
+    if args.host_bench:
+        init_headless()
+        run_host_benchmark(args.host_bench, 5.0)
+    elif args.ai_bench:
+        init_headless()
+        run_ai_benchmark(10.0)
+    elif args.swarm_bench:
+        init_headless()
+        run_swarm_benchmark(args.swarm_bench, 5.0)
+    else:
+        main(ai=args.ai, swarm=args.swarm, stress=args.stress)
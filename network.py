@@ -0,0 +1,824 @@
+"""
+Chế độ chơi qua mạng cho Tank Battle.
+
+Máy chủ (authoritative) chạy mô phỏng của nhiều trận đấu trên cùng một vòng
+lặp asyncio UDP. Máy khách chỉ gửi trạng thái phím, nhận lại snapshot đã được
+lượng tử hóa và nén delta so với snapshot gần nhất mà máy khách đã xác nhận,
+và tự dự đoán chuyển động xe tăng của mình (client-side prediction).
+
+Cách dùng:
+    python network.py server [--host 0.0.0.0] [--port 5050]
+    python network.py client HOST [--port 5050]
+    python network.py bots [--host 127.0.0.1] [--port 5050] [--count 64] [--seconds 20]
+    python network.py bench [--matches 32] [--seconds 15]
+"""
+import argparse
+import asyncio
+import collections
+import multiprocessing
+import random
+import socket
+import statistics
+import struct
+import time
+
+import pygame
+import main as game
+
+DEFAULT_PORT = 5050
+TICK_RATE = game.FPS
+SNAPSHOT_EVERY = 2      # Gửi snapshot mỗi 2 tick (30 lần/giây)
+HISTORY_SIZE = 64       # Số snapshot giữ lại làm mốc nén delta
+MAX_PENDING_INPUTS = 8  # Giới hạn hàng đợi phím để không bị trễ tích lũy
+INPUT_REDUNDANCY = 4    # Mỗi gói phím gửi kèm các phím gần nhất để chống mất gói
+CLIENT_TIMEOUT = 5.0
+MAX_MAZE_SIDE = 64      # Số cột/hàng tối đa của mê cung nhận từ máy chủ
+TICK_HISTORY = 60 * TICK_RATE  # Số tick gần nhất giữ lại để tính thống kê (1 phút)
+
+# Lượng tử hóa: tọa độ theo 1/4 pixel, góc theo 1/65536 vòng
+POS_SCALE = 4
+ANGLE_SCALE = 65536 / 360
+
+# Loại gói tin
+MSG_JOIN = 1
+MSG_WELCOME = 2
+MSG_INPUT = 3
+MSG_MAZE = 4
+MSG_SNAPSHOT = 5
+MSG_LEAVE = 6
+
+# Bit của trạng thái phím
+BUTTONS = (("up", 1), ("down", 2), ("left", 4), ("right", 8), ("shoot", 16))
+BTN_RESTART = 32
+
+# Loại thực thể trong snapshot và số trường của mỗi loại
+KIND_TANK, KIND_BULLET, KIND_ENEMY = 0, 1, 2
+FIELD_COUNTS = {KIND_TANK: 4, KIND_BULLET: 2, KIND_ENEMY: 2}
+
+# Cờ trạng thái trận đấu trong snapshot
+FLAG_GAME_OVER = 1
+FLAG_PLAYER2_WON = 2
+
+WELCOME = struct.Struct("<BHB")        # loại, mã trận, vị trí người chơi
+MAZE = struct.Struct("<BBBB")          # loại, phiên bản mê cung, số cột, số hàng
+INPUT = struct.Struct("<BIIBB")        # loại, seq mới nhất, tick đã nhận, phiên bản mê cung, số phím
+SNAPSHOT = struct.Struct("<BIIIBB")    # loại, tick, tick mốc, seq phím đã xử lý, phiên bản mê cung, cờ
+COUNT = struct.Struct("<H")
+ENTITY = struct.Struct("<BHB")         # loại thực thể, mã, mặt nạ trường thay đổi
+REMOVED = struct.Struct("<BH")
+FIELD = struct.Struct("<H")
+
+PLAYER_CONTROLS = (game.PLAYER1_CONTROLS, game.PLAYER2_CONTROLS)
+PLAYER_COLORS = (game.GREEN, game.RED)
+
+def buttons_to_keys(buttons, controls):
+    """
+    Chuyển bitmask phím thành bảng tra cứu phím mà Tank.move và Match.step dùng.
+
+    Tham số:
+        buttons (int): Bitmask trạng thái phím.
+        controls (dict): Phím điều khiển của xe tăng.
+
+    Trả về:
+        dict: Ánh xạ phím pygame -> đang nhấn hay không.
+    """
+    return {controls[name]: bool(buttons & bit) for name, bit in BUTTONS}
+
+def keys_to_buttons(keys_pressed, controls):
+    """
+    Chuyển trạng thái bàn phím thành bitmask phím theo bộ điều khiển cho trước.
+    """
+    buttons = 0
+    for name, bit in BUTTONS:
+        if keys_pressed[controls[name]]:
+            buttons |= bit
+    return buttons
+
+def quantize_position(value):
+    """Lượng tử hóa một tọa độ thành số nguyên 16 bit."""
+    return min(max(int(round(value * POS_SCALE)), 0), 0xFFFF)
+
+def quantize_angle(angle):
+    """Lượng tử hóa góc (độ) thành số nguyên 16 bit."""
+    return int(round((angle % 360) * ANGLE_SCALE)) & 0xFFFF
+
+def encode_delta(state, base):
+    """
+    Nén delta trạng thái hiện tại so với trạng thái mốc.
+
+    Chỉ những thực thể mới hoặc có trường thay đổi mới được ghi, kèm mặt nạ
+    bit cho biết trường nào thay đổi; thực thể biến mất được ghi vào danh sách xóa.
+
+    Tham số:
+        state (dict): Trạng thái hiện tại {(loại, mã): tuple các trường}.
+        base (dict): Trạng thái mốc mà máy khách đã có.
+
+    Trả về:
+        bytes: Dữ liệu đã nén.
+    """
+    removed = [key for key in base if key not in state]
+    body = bytearray(COUNT.pack(len(removed)))
+    for kind, uid in removed:
+        body += REMOVED.pack(kind, uid)
+
+    changed = bytearray()
+    changed_count = 0
+    for key, values in state.items():
+        old = base.get(key)
+        if old == values:
+            continue
+        mask = 0
+        for index, value in enumerate(values):
+            if old is None or old[index] != value:
+                mask |= 1 << index
+        changed += ENTITY.pack(key[0], key[1], mask)
+        for index, value in enumerate(values):
+            if mask & (1 << index):
+                changed += FIELD.pack(value)
+        changed_count += 1
+    body += COUNT.pack(changed_count)
+    body += changed
+    return bytes(body)
+
+def decode_delta(data, offset, base):
+    """
+    Giải nén delta, áp dụng lên trạng thái mốc.
+
+    Tham số:
+        data (bytes): Gói tin.
+        offset (int): Vị trí bắt đầu phần delta trong gói.
+        base (dict): Trạng thái mốc.
+
+    Trả về:
+        dict: Trạng thái đầy đủ sau khi áp dụng delta.
+    """
+    state = dict(base)
+    (removed_count,) = COUNT.unpack_from(data, offset)
+    offset += COUNT.size
+    for _ in range(removed_count):
+        state.pop(REMOVED.unpack_from(data, offset), None)
+        offset += REMOVED.size
+
+    (changed_count,) = COUNT.unpack_from(data, offset)
+    offset += COUNT.size
+    for _ in range(changed_count):
+        kind, uid, mask = ENTITY.unpack_from(data, offset)
+        offset += ENTITY.size
+        key = (kind, uid)
+        values = list(state.get(key, (0,) * FIELD_COUNTS[kind]))
+        for index in range(FIELD_COUNTS[kind]):
+            if mask & (1 << index):
+                (values[index],) = FIELD.unpack_from(data, offset)
+                offset += FIELD.size
+        state[key] = tuple(values)
+    return state
+
+class ClientSession:
+    """
+    Trạng thái phía máy chủ của một máy khách đã kết nối.
+
+    Thuộc tính:
+        addr: Địa chỉ UDP của máy khách
+        match: Trận đấu mà máy khách tham gia
+        slot: Vị trí người chơi (0 hoặc 1)
+        pending: Hàng đợi (seq, phím) chưa được mô phỏng
+        last_received_seq: Seq phím mới nhất đã nhận
+        last_applied_seq: Seq phím mới nhất đã được mô phỏng
+        buttons: Trạng thái phím đang áp dụng
+        ack_tick: Tick snapshot mới nhất máy khách đã nhận
+        maze_version: Phiên bản mê cung mà máy khách đang có
+        last_seen: Thời điểm nhận gói tin gần nhất
+    """
+    def __init__(self, addr, match, slot):
+        self.addr = addr
+        self.match = match
+        self.slot = slot
+        self.pending = collections.deque()
+        self.last_received_seq = 0
+        self.last_applied_seq = 0
+        self.buttons = 0
+        self.ack_tick = 0
+        self.maze_version = -1
+        self.last_seen = time.monotonic()
+
+    def receive_input(self, seq, buttons_list, ack_tick, maze_version):
+        """
+        Ghi nhận một gói phím (gồm các phím gần nhất, cũ trước mới sau).
+        """
+        first_seq = seq - len(buttons_list) + 1
+        for offset, buttons in enumerate(buttons_list):
+            input_seq = first_seq + offset
+            if input_seq > self.last_received_seq:
+                self.pending.append((input_seq, buttons))
+                self.last_received_seq = input_seq
+        while len(self.pending) > MAX_PENDING_INPUTS:
+            self.pending.popleft()
+        self.ack_tick = max(self.ack_tick, ack_tick)
+        self.maze_version = maze_version
+        self.last_seen = time.monotonic()
+
+    def next_buttons(self):
+        """
+        Lấy phím cho tick tiếp theo; nếu hàng đợi rỗng thì giữ nguyên phím cũ.
+        """
+        if self.pending:
+            self.last_applied_seq, self.buttons = self.pending.popleft()
+        return self.buttons
+
+class NetMatch:
+    """
+    Một trận đấu trên máy chủ: một game.Match cùng hai phiên máy khách.
+
+    Thuộc tính:
+        match_id: Mã trận đấu
+        match: Trận đấu được mô phỏng (game.Match)
+        sessions: Hai phiên máy khách (None nếu còn trống)
+        maze_version: Phiên bản mê cung, tăng mỗi lần tạo mê cung mới
+        maze_packet: Gói tin mô tả mê cung hiện tại
+        history: Các snapshot gần đây dùng làm mốc nén delta
+    """
+    def __init__(self, match_id):
+        self.match_id = match_id
+        self.match = game.Match()
+        self.sessions = [None, None]
+        self.maze_version = 0
+        self.history = collections.OrderedDict()
+        self.update_maze()
+
+    def update_maze(self):
+        """
+        Tăng phiên bản mê cung và chuẩn bị gói tin mê cung mới.
+        """
+        self.maze_version = (self.maze_version + 1) & 0xFF
+        geometry = self.match.geometry
+        self.maze_packet = (MAZE.pack(MSG_MAZE, self.maze_version, geometry.cols, geometry.rows)
+                            + self.match.grid_bits)
+
+    def is_full(self):
+        return all(self.sessions)
+
+    def read_inputs(self, match):
+        """
+        Hàm điều khiển cho game.MatchHost: trả về phím của hai người chơi cho tick
+        tiếp theo, hoặc None khi trận còn thiếu người.
+        """
+        if not self.is_full():
+            return None
+        keys_pressed = {}
+        restart = False
+        for session, player in zip(self.sessions, match.players):
+            buttons = session.next_buttons()
+            keys_pressed.update(buttons_to_keys(buttons, player.controls))
+            restart = restart or bool(buttons & BTN_RESTART)
+        if match.game_over and restart:
+            match.restart()
+            self.update_maze()
+        return keys_pressed
+
+    def capture_state(self):
+        """
+        Chụp trạng thái đã lượng tử hóa của trận đấu và lưu vào lịch sử.
+
+        Trả về:
+            dict: {(loại, mã): tuple các trường}
+        """
+        state = {}
+        for slot, player in enumerate(self.match.players):
+            state[(KIND_TANK, slot)] = (quantize_position(player.body.x),
+                                        quantize_position(player.body.y),
+                                        quantize_angle(player.angle),
+                                        player.score)
+            for bullet in player.bullets:
+                state[(KIND_BULLET, bullet.uid & 0xFFFF)] = (quantize_position(bullet.x),
+                                                             quantize_position(bullet.y))
+        for uid, x, y, _ in self.match.enemy_manager.sprite_states():
+            state[(KIND_ENEMY, uid & 0xFFFF)] = (quantize_position(x), quantize_position(y))
+        self.history[self.match.tick] = state
+        while len(self.history) > HISTORY_SIZE:
+            self.history.popitem(last=False)
+        return state
+
+    def flags(self):
+        if not self.match.game_over:
+            return 0
+        flags = FLAG_GAME_OVER
+        if self.match.winner == "Player 2":
+            flags |= FLAG_PLAYER2_WON
+        return flags
+
+class GameServer(asyncio.DatagramProtocol):
+    """
+    Máy chủ UDP chạy nhiều trận đấu trên một vòng lặp tick duy nhất (game.MatchHost).
+
+    Thuộc tính:
+        host: game.MatchHost mô phỏng tất cả các trận
+        matches: Các trận đấu đang chạy theo mã trận
+        sessions: Các phiên máy khách theo địa chỉ
+        bytes_sent, packets_sent: Thống kê băng thông chiều xuống
+        bytes_received: Thống kê băng thông chiều lên
+        peak_matches, peak_clients: Số trận và số máy khách lớn nhất cùng lúc
+        ticks: Số tick đã chạy
+        tick_times: Thời gian xử lý của TICK_HISTORY tick gần nhất (giây)
+    """
+    def __init__(self):
+        self.transport = None
+        self.host = game.MatchHost()
+        self.matches = {}
+        self.sessions = {}
+        self.next_match_id = 1
+        self.bytes_sent = 0
+        self.packets_sent = 0
+        self.snapshot_bytes = 0
+        self.snapshots_sent = 0
+        self.bytes_received = 0
+        self.peak_matches = 0
+        self.peak_clients = 0
+        self.ticks = 0
+        self.tick_times = collections.deque(maxlen=TICK_HISTORY)
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def send(self, data, addr):
+        self.transport.sendto(data, addr)
+        self.bytes_sent += len(data)
+        self.packets_sent += 1
+
+    def datagram_received(self, data, addr):
+        self.bytes_received += len(data)
+        if not data:
+            return
+        message = data[0]
+        if message == MSG_JOIN:
+            self.join(addr)
+        elif message == MSG_INPUT and addr in self.sessions and len(data) >= INPUT.size:
+            _, seq, ack_tick, maze_version, count = INPUT.unpack_from(data)
+            buttons_list = data[INPUT.size:INPUT.size + count]
+            self.sessions[addr].receive_input(seq, buttons_list, ack_tick, maze_version)
+        elif message == MSG_LEAVE:
+            self.leave(addr)
+
+    def join(self, addr):
+        """
+        Ghép máy khách vào trận còn chỗ trống, hoặc tạo trận mới.
+        """
+        session = self.sessions.get(addr)
+        if session is None:
+            match = next((m for m in self.matches.values() if not m.is_full()), None)
+            if match is None:
+                match = NetMatch(self.next_match_id)
+                self.matches[match.match_id] = match
+                self.host.add(match.match, match.read_inputs)
+                self.next_match_id = (self.next_match_id + 1) & 0xFFFF or 1
+            slot = match.sessions.index(None)
+            session = ClientSession(addr, match, slot)
+            match.sessions[slot] = session
+            self.sessions[addr] = session
+            self.peak_matches = max(self.peak_matches, len(self.matches))
+            self.peak_clients = max(self.peak_clients, len(self.sessions))
+        self.send(WELCOME.pack(MSG_WELCOME, session.match.match_id, session.slot), addr)
+        self.send(session.match.maze_packet, addr)
+
+    def leave(self, addr):
+        """
+        Xóa máy khách; trận đấu không còn ai sẽ bị hủy.
+        """
+        session = self.sessions.pop(addr, None)
+        if session is None:
+            return
+        match = session.match
+        match.sessions[session.slot] = None
+        if not any(match.sessions):
+            del self.matches[match.match_id]
+            self.host.remove(match.match)
+
+    def send_snapshot(self, session, state):
+        """
+        Gửi snapshot nén delta so với snapshot mà máy khách đã xác nhận.
+        """
+        match = session.match
+        if session.maze_version != match.maze_version:
+            self.send(match.maze_packet, session.addr)
+        base = match.history.get(session.ack_tick)
+        base_tick = session.ack_tick if base is not None else 0
+        packet = SNAPSHOT.pack(MSG_SNAPSHOT, match.match.tick, base_tick, session.last_applied_seq,
+                               match.maze_version, match.flags())
+        packet += encode_delta(state, base or {})
+        self.send(packet, session.addr)
+        self.snapshot_bytes += len(packet)
+        self.snapshots_sent += 1
+
+    def tick(self):
+        """
+        Mô phỏng một tick cho mọi trận đủ người và gửi snapshot khi đến lượt.
+        """
+        now = time.monotonic()
+        for addr in [a for a, s in self.sessions.items() if now - s.last_seen > CLIENT_TIMEOUT]:
+            self.leave(addr)
+
+        self.host.tick()
+        for match in self.matches.values():
+            if match.match.game_over:
+                # Tạo trước mê cung cho lần chơi lại, không làm chậm vòng tick
+                match.match.prefetch_next_maze()
+            if match.is_full() and match.match.tick % SNAPSHOT_EVERY == 0:
+                state = match.capture_state()
+                for session in match.sessions:
+                    self.send_snapshot(session, state)
+
+    async def run(self, duration=None):
+        """
+        Chạy vòng lặp tick với tốc độ cố định TICK_RATE.
+
+        Tham số:
+            duration (float): Thời gian chạy (giây), None để chạy mãi.
+        """
+        loop = asyncio.get_running_loop()
+        interval = 1.0 / TICK_RATE
+        start = next_tick = loop.time()
+        while duration is None or loop.time() - start < duration:
+            tick_start = time.perf_counter()
+            self.tick()
+            tick_seconds = time.perf_counter() - tick_start
+            self.ticks += 1
+            self.tick_times.append(tick_seconds)
+            game.telemetry.observe("server_tick_seconds", tick_seconds)
+            next_tick += interval
+            delay = next_tick - loop.time()
+            if delay < -interval:
+                # Bị trễ quá nhiều thì bỏ qua các tick đã lỡ
+                next_tick = loop.time()
+                delay = 0
+            await asyncio.sleep(max(delay, 0))
+
+    def report(self, elapsed):
+        """
+        Tổng hợp thống kê tốc độ tick và băng thông.
+        """
+        times = sorted(self.tick_times) or [0.0]
+        clients = max(self.peak_clients, 1)
+        return {
+            "matches": self.peak_matches,
+            "clients": self.peak_clients,
+            "ticks": self.ticks,
+            "tick_rate": self.ticks / elapsed if elapsed else 0.0,
+            "tick_mean_ms": statistics.fmean(times) * 1000,
+            "tick_p99_ms": times[int(len(times) * 0.99) - 1 if len(times) > 1 else 0] * 1000,
+            "down_bytes_per_client": self.bytes_sent / elapsed / clients if elapsed else 0.0,
+            "up_bytes_per_client": self.bytes_received / elapsed / clients if elapsed else 0.0,
+            "snapshot_bytes": self.snapshot_bytes / max(self.snapshots_sent, 1),
+        }
+
+async def serve(host, port, duration=None):
+    """
+    Khởi động máy chủ và chạy vòng lặp tick.
+
+    Trả về:
+        dict: Thống kê khi kết thúc (nếu có duration).
+    """
+    loop = asyncio.get_running_loop()
+    transport, server = await loop.create_datagram_endpoint(
+        GameServer, local_addr=(host, port))
+    start = time.perf_counter()
+    try:
+        await server.run(duration)
+    finally:
+        transport.close()
+    return server.report(time.perf_counter() - start)
+
+class NetClient(asyncio.DatagramProtocol):
+    """
+    Máy khách UDP: gửi phím, nhận và giải nén snapshot.
+
+    Thuộc tính:
+        match_id, slot: Trận đấu và vị trí được máy chủ gán (None khi chưa vào)
+        grid, geometry, walls: Mê cung nhận từ máy chủ
+        maze_version: Phiên bản mê cung hiện có
+        states: Các snapshot đã giải nén theo tick (dùng làm mốc delta)
+        latest_tick: Tick của snapshot mới nhất
+        acked_seq: Seq phím mới nhất mà máy chủ đã mô phỏng
+        flags: Cờ trạng thái trận đấu của snapshot mới nhất
+        inputs: Lịch sử (seq, phím) để gửi lại và dự đoán lại
+        bytes_received, snapshots_received: Thống kê
+    """
+    def __init__(self):
+        self.transport = None
+        self.match_id = None
+        self.slot = None
+        self.grid = None
+        self.geometry = None
+        self.walls = []
+        self.wall_index = None
+        self.maze_version = -1
+        self.states = collections.OrderedDict()
+        self.latest_tick = 0
+        self.acked_seq = 0
+        self.flags = 0
+        self.seq = 0
+        self.inputs = collections.deque(maxlen=TICK_RATE)
+        self.bytes_received = 0
+        self.snapshots_received = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def join(self):
+        self.transport.sendto(bytes((MSG_JOIN,)))
+
+    def leave(self):
+        self.transport.sendto(bytes((MSG_LEAVE,)))
+
+    def datagram_received(self, data, addr):
+        self.bytes_received += len(data)
+        if not data:
+            return
+        message = data[0]
+        if message == MSG_WELCOME:
+            _, self.match_id, self.slot = WELCOME.unpack_from(data)
+        elif message == MSG_MAZE:
+            _, version, cols, rows = MAZE.unpack_from(data)
+            if version != self.maze_version and self.load_maze(data[MAZE.size:], cols, rows):
+                self.maze_version = version
+        elif message == MSG_SNAPSHOT:
+            self.receive_snapshot(data)
+
+    def load_maze(self, grid_bits, cols, rows):
+        """
+        Dựng tường và chỉ mục tường từ lưới bit nhận qua gói MAZE.
+
+        Máy khách chỉ cần tường để vẽ và dự đoán va chạm nên không tạo
+        MazeArtifact (bảng khoảng cách giữa mọi cặp ô sẽ rất lớn với lưới
+        255x255 từ một gói tin lỗi). Gói có kích thước không khớp hoặc lưới lớn
+        hơn MAX_MAZE_SIDE bị bỏ qua.
+
+        Trả về:
+            bool: True nếu đã dựng được mê cung.
+        """
+        if (not 0 < cols <= MAX_MAZE_SIDE or not 0 < rows <= MAX_MAZE_SIDE or
+                len(grid_bits) != (cols * rows + 7) // 8):
+            return False
+        self.grid = game.unpack_grid(grid_bits, cols, rows)
+        self.geometry = game.GridGeometry(cols, rows, game.WIDTH // cols, game.HEIGHT // rows)
+        self.walls = [game.Wall(*rect) for rect in game.Wall.merged_wall_rects(self.grid, self.geometry)]
+        self.wall_index = game.WallIndex(self.walls, self.geometry)
+        return True
+
+    def receive_snapshot(self, data):
+        _, tick, base_tick, acked_seq, maze_version, flags = SNAPSHOT.unpack_from(data)
+        if tick <= self.latest_tick:
+            return  # Gói đến muộn hoặc trùng
+        if base_tick:
+            base = self.states.get(base_tick)
+            if base is None:
+                return  # Không còn mốc để giải nén
+        else:
+            base = {}
+        self.states[tick] = decode_delta(data, SNAPSHOT.size, base)
+        while len(self.states) > HISTORY_SIZE:
+            self.states.popitem(last=False)
+        self.latest_tick = tick
+        self.acked_seq = acked_seq
+        self.flags = flags
+        self.snapshots_received += 1
+
+    def send_input(self, buttons):
+        """
+        Gửi phím của frame hiện tại, kèm vài phím trước đó để chống mất gói.
+
+        Trả về:
+            int: Seq của phím vừa gửi.
+        """
+        self.seq += 1
+        self.inputs.append((self.seq, buttons))
+        recent = list(self.inputs)[-INPUT_REDUNDANCY:]
+        packet = INPUT.pack(MSG_INPUT, self.seq, self.latest_tick,
+                            self.maze_version & 0xFF, len(recent))
+        self.transport.sendto(packet + bytes(b for _, b in recent))
+        return self.seq
+
+    def latest_state(self):
+        return self.states.get(self.latest_tick, {})
+
+def apply_tank_state(tank, values):
+    """
+    Đặt vị trí, góc và điểm của xe tăng theo trạng thái đã lượng tử hóa.
+    """
+    x, y, angle, score = values
+    tank.set_position(x / POS_SCALE, y / POS_SCALE)
+    tank.angle = angle / ANGLE_SCALE
+    tank.score = score
+
+def draw_net_tank(window, tank):
+    """
+    Vẽ xe tăng mà không thay đổi tank.rect, để vùng va chạm khi dự đoán
+    luôn khớp với máy chủ.
+    """
+    image = pygame.transform.rotate(tank.image_original, tank.angle)
+    window.blit(image, image.get_rect(center=tank.rect.center))
+
+async def play(host, port):
+    """
+    Chạy máy khách có giao diện: đọc bàn phím (WASD/mũi tên + SPACE, R để chơi lại),
+    dự đoán xe tăng của mình và vẽ trạng thái nhận từ máy chủ.
+    """
+    pygame.init()
+    window = pygame.display.set_mode((game.WIDTH, game.HEIGHT))
+    pygame.display.set_caption("Tank Battle - Online")
+    font = game.load_font("comicsans", 36)
+    text_cache = game.TextCache(font, game.RED)
+
+    loop = asyncio.get_running_loop()
+    transport, client = await loop.create_datagram_endpoint(
+        NetClient, remote_addr=(host, port))
+    tanks = [game.Tank(0, 0, color, controls)
+             for color, controls in zip(PLAYER_COLORS, PLAYER_CONTROLS)]
+    frame_time = 1.0 / game.FPS
+    last_join = 0.0
+    running = True
+    while running:
+        frame_start = loop.time()
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+
+        if client.slot is None or client.grid is None:
+            if frame_start - last_join > 0.5:
+                client.join()
+                last_join = frame_start
+            window.fill(game.WHITE)
+            text = text_cache.text("waiting", "Waiting for server...")
+            window.blit(text, (game.WIDTH // 2 - text.get_width() // 2, game.HEIGHT // 2))
+            pygame.display.update()
+            await asyncio.sleep(frame_time)
+            continue
+
+        keys = pygame.key.get_pressed()
+        buttons = keys_to_buttons(keys, PLAYER_CONTROLS[0]) | keys_to_buttons(keys, PLAYER_CONTROLS[1])
+        if keys[pygame.K_r]:
+            buttons |= BTN_RESTART
+        client.send_input(buttons)
+
+        # Đặt lại theo trạng thái máy chủ rồi mô phỏng lại các phím chưa được xử lý
+        state = client.latest_state()
+        for slot, tank in enumerate(tanks):
+            if (KIND_TANK, slot) in state:
+                apply_tank_state(tank, state[(KIND_TANK, slot)])
+        own, other = tanks[client.slot], tanks[1 - client.slot]
+        if client.wall_index and not client.flags & FLAG_GAME_OVER:
+            for seq, pending in client.inputs:
+                if seq > client.acked_seq:
+                    own.move(buttons_to_keys(pending, own.controls), client.wall_index, other)
+
+        window.fill(game.WHITE)
+        for (kind, _), values in state.items():
+            x, y = values[0] / POS_SCALE, values[1] / POS_SCALE
+            if kind == KIND_ENEMY:
+                pygame.draw.rect(window, game.RED, pygame.Rect(x - 5, y - 5, 10, 10))
+            elif kind == KIND_BULLET:
+                pygame.draw.circle(window, game.BLACK, (int(x), int(y)), game.BULLET_RADIUS)
+        for wall in client.walls:
+            wall.draw(window)
+        for tank in tanks:
+            draw_net_tank(window, tank)
+
+        score_text = text_cache.compose("score", ("P1: ", *str(tanks[0].score),
+                                                  "    P2: ", *str(tanks[1].score)))
+        window.blit(score_text, (game.WIDTH // 2 - score_text.get_width() // 2, 10))
+        if client.flags & FLAG_GAME_OVER:
+            winner = "Player 2" if client.flags & FLAG_PLAYER2_WON else "Player 1"
+            winner_text = text_cache.text("winner", f"{winner} Wins!")
+            restart_text = text_cache.text("restart", "Press R to restart")
+            window.blit(winner_text, (game.WIDTH // 2 - winner_text.get_width() // 2, game.HEIGHT // 2 - 20))
+            window.blit(restart_text, (game.WIDTH // 2 - restart_text.get_width() // 2, game.HEIGHT // 2 + 20))
+        pygame.display.update()
+
+        await asyncio.sleep(max(frame_time - (loop.time() - frame_start), 0))
+
+    client.leave()
+    transport.close()
+    pygame.quit()
+
+async def run_bots(host, port, count, duration):
+    """
+    Chạy nhiều bot máy khách gửi phím ngẫu nhiên, dùng để kiểm thử tải.
+
+    Trả về:
+        dict: Thống kê phía máy khách.
+    """
+    loop = asyncio.get_running_loop()
+    bots = []
+    for _ in range(count):
+        transport, client = await loop.create_datagram_endpoint(
+            NetClient, remote_addr=(host, port))
+        client.join()
+        bots.append((transport, client))
+
+    interval = 1.0 / TICK_RATE
+    start = next_tick = loop.time()
+    buttons = [0] * count
+    while loop.time() - start < duration:
+        for index, (_, client) in enumerate(bots):
+            if client.slot is None:
+                if random.random() < 0.05:
+                    client.join()
+                continue
+            if random.random() < 0.05:
+                buttons[index] = random.getrandbits(6)
+            client.send_input(buttons[index])
+        next_tick += interval
+        await asyncio.sleep(max(next_tick - loop.time(), 0))
+
+    elapsed = loop.time() - start
+    for transport, client in bots:
+        client.leave()
+        transport.close()
+    return {
+        "bots": count,
+        "joined": sum(client.slot is not None for _, client in bots),
+        "snapshots_per_bot": sum(c.snapshots_received for _, c in bots) / count / elapsed,
+        "down_bytes_per_bot": sum(c.bytes_received for _, c in bots) / count / elapsed,
+    }
+
+def _server_process(host, port, duration, results):
+    game.init_headless()
+    results.put(asyncio.run(serve(host, port, duration)))
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def bench(matches, seconds):
+    """
+    Đo tải: chạy máy chủ ở một tiến trình riêng và 2 bot cho mỗi trận qua localhost,
+    rồi in tốc độ tick, thời gian tick và băng thông.
+    """
+    host, port = "127.0.0.1", free_port()
+    results = multiprocessing.Queue()
+    server = multiprocessing.Process(target=_server_process,
+                                     args=(host, port, seconds + 2.0, results))
+    server.start()
+    time.sleep(1.0)
+    bot_stats = asyncio.run(run_bots(host, port, matches * 2, seconds))
+    stats = results.get()
+    server.join()
+
+    budget_ms = 1000.0 / TICK_RATE
+    per_match_ms = stats["tick_mean_ms"] / max(matches, 1)
+    print(f"Matches: {matches}  Bots: {bot_stats['bots']} (joined {bot_stats['joined']})")
+    print(f"Server tick rate: {stats['tick_rate']:.1f} Hz (target {TICK_RATE} Hz)")
+    print(f"Server tick time: mean {stats['tick_mean_ms']:.2f} ms, p99 {stats['tick_p99_ms']:.2f} ms "
+          f"(budget {budget_ms:.1f} ms)")
+    print(f"Cost per match: {per_match_ms:.3f} ms/tick -> ~{int(budget_ms / per_match_ms) if per_match_ms else 0} "
+          f"matches per process at {TICK_RATE} Hz")
+    print(f"Downstream: {bot_stats['down_bytes_per_bot']:.0f} B/s per client, "
+          f"{bot_stats['snapshots_per_bot']:.1f} snapshots/s, "
+          f"mean snapshot {stats['snapshot_bytes']:.0f} B")
+    print(f"Upstream: {stats['up_bytes_per_client']:.0f} B/s per client")
+
+def main():
+    parser = argparse.ArgumentParser(description="Tank Battle network mode")
+    commands = parser.add_subparsers(dest="command", required=True)
+    server_parser = commands.add_parser("server")
+    server_parser.add_argument("--host", default="0.0.0.0")
+    server_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    server_parser.add_argument("--telemetry", metavar="PATH",
+                               help="Ghi số liệu telemetry ra file JSONL (xoay vòng)")
+    server_parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                               help="Mở endpoint Prometheus tại http://127.0.0.1:PORT/metrics")
+    server_parser.add_argument("--no-maze-cache", action="store_true",
+                               help="Không ghi mê cung mới tạo vào bộ nhớ đệm trên đĩa")
+    client_parser = commands.add_parser("client")
+    client_parser.add_argument("host")
+    client_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    bots_parser = commands.add_parser("bots")
+    bots_parser.add_argument("--host", default="127.0.0.1")
+    bots_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    bots_parser.add_argument("--count", type=int, default=64)
+    bots_parser.add_argument("--seconds", type=float, default=20.0)
+    bench_parser = commands.add_parser("bench")
+    bench_parser.add_argument("--matches", type=int, default=32)
+    bench_parser.add_argument("--seconds", type=float, default=15.0)
+    args = parser.parse_args()
+
+    if args.command == "server":
+        game.init_headless()
+        if args.no_maze_cache:
+            game.MAZE_CACHE_WRITE = False
+        if args.telemetry:
+            game.telemetry.start_jsonl(args.telemetry)
+        if args.metrics_port:
+            game.telemetry.serve_prometheus(args.metrics_port)
+        try:
+            asyncio.run(serve(args.host, args.port))
+        finally:
+            game.telemetry.stop()
+    elif args.command == "client":
+        asyncio.run(play(args.host, args.port))
+    elif args.command == "bots":
+        print(asyncio.run(run_bots(args.host, args.port, args.count, args.seconds)))
+    elif args.command == "bench":
+        bench(args.matches, args.seconds)
+
+if __name__ == "__main__":
+    main()